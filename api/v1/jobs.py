@@ -0,0 +1,19 @@
+from flask_restful import Resource
+
+from tools import auth
+
+
+class API(Resource):
+    url_params = [
+        '<string:job_id>',
+    ]
+
+    def __init__(self, module):
+        self.module = module
+
+    @auth.decorators.check_api(["projects.projects.project.view"])
+    def get(self, job_id: str):
+        job = self.module.project_jobs.get(job_id)
+        if not job:
+            return {"message": "Job not found"}, 404
+        return job.to_json(), 200
@@ -0,0 +1,26 @@
+from flask import Response
+from flask_restful import Resource
+
+from tools import auth
+
+from ...utils.metrics import registry
+
+
+class API(Resource):
+    url_params = [
+        '',
+    ]
+
+    def __init__(self, module):
+        self.module = module
+
+    @auth.decorators.check_api({
+        "permissions": ["projects.projects.metrics.view"],
+        "recommended_roles": {
+            "administration": {"admin": True, "viewer": False, "editor": False},
+            "default": {"admin": False, "viewer": False, "editor": False},
+            "developer": {"admin": False, "viewer": False, "editor": False},
+        }})
+    def get(self):
+        """ Step timings in prometheus text exposition format """
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
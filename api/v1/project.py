@@ -7,14 +7,14 @@ from pylon.core.tools import log
 
 from pydantic import ValidationError
 
-from tools import auth, VaultClient, TaskManager, db, api_tools, db_tools
+from tools import auth, api_tools
 
-from sqlalchemy.exc import NoResultFound
 from ...models.pd.project import ProjectCreatePD
 from ...models.project import Project
 
-from ...utils import get_project_user
-from ...utils.project_steps import create_project, get_steps
+from ...utils import secrets_cache
+from ...utils.jobs import ProjectJob
+from ...utils.project_steps import create_project, delete_project, new_run
 
 
 class ProjectAPI(api_tools.APIModeHandler):
@@ -32,20 +32,24 @@ class ProjectAPI(api_tools.APIModeHandler):
         offset_ = request.args.get("offset")
         limit_ = request.args.get("limit")
         search_ = request.args.get("search")
+        after_id = request.args.get("after_id", type=int)
+        with_total = request.args.get("with_total", default=False, type=lambda x: x.lower() in ("true", "1"))
+        fields = request.args.get("fields", type=lambda x: x.split(","))
         #
         check_public_role = request.args.get("check_public_role")
         projects = self.module.list_user_projects(
-            user_id, offset_=offset_, limit_=limit_, search_=search_
+            user_id, offset_=offset_, limit_=limit_, search_=search_,
+            after_id=after_id, with_total=with_total, fields=fields
         )
 
         if check_public_role:
-            vault_client = VaultClient()
-            secrets = vault_client.get_all_secrets()
+            secrets = secrets_cache.get_all_secrets()
+            rows = projects['rows'] if with_total else projects
             try:
                 public_project = int(secrets['ai_project_id'])
                 public_admin = secrets['ai_public_admin']
                 filtered_ids = list()
-                for project in projects:
+                for project in rows:
                     if project['id'] == public_project:
                         roles = [role['name'] for role in self.module.context.rpc_manager.timeout(
                             2
@@ -54,7 +58,11 @@ class ProjectAPI(api_tools.APIModeHandler):
                         )]
                         if public_admin in roles:
                             filtered_ids.append(project['id'])
-                projects = [p for p in projects if p['id'] in filtered_ids]
+                rows = [p for p in rows if p['id'] in filtered_ids]
+                if with_total:
+                    projects['rows'] = rows
+                else:
+                    projects = rows
             except KeyError as e:
                 log.error(e)
             except Empty as e:
@@ -76,9 +84,13 @@ class AdminAPI(api_tools.APIModeHandler):
         offset_ = request.args.get("offset")
         limit_ = request.args.get("limit")
         search_ = request.args.get("search")
+        after_id = request.args.get("after_id", type=int)
+        with_total = request.args.get("with_total", default=False, type=lambda x: x.lower() in ("true", "1"))
+        fields = request.args.get("fields", type=lambda x: x.split(","))
         #
         return self.module.list_user_projects(
-            user_id, offset_=offset_, limit_=limit_, search_=search_
+            user_id, offset_=offset_, limit_=limit_, search_=search_,
+            after_id=after_id, with_total=with_total, fields=fields
         ), 200
 
     @auth.decorators.check_api({
@@ -102,14 +114,26 @@ class AdminAPI(api_tools.APIModeHandler):
             'owner_id': g.auth.id,
             'roles': ['admin', ]
         }
-        
-        try:
-            progress = create_project(self.module, context)
 
+        run = new_run(self.module)
+        if request.args.get("async", default=False, type=lambda x: x.lower() in ("true", "1")):
+            def create(job: ProjectJob) -> None:
+                def on_finish(step, result, error) -> None:
+                    if step.name == 'project_model' and error is None:
+                        job.project_id = context['project'].id
+
+                create_project(self.module, context, on_finish=on_finish, run=job.run)
+
+            job = ProjectJob(run)
+            self.module.project_jobs.submit(job, create)
+            return job.to_json(), 202
+
+        try:
+            create_project(self.module, context, run=run)
         except Exception as e:
             log.critical(format_exc())
             status_code = 400
-        statuses: List[dict] = [step.status['created'] for step in progress]
+        statuses: List[dict] = run.to_json()
         return {'steps': statuses}, status_code
 
     @auth.decorators.check_api({
@@ -132,6 +156,7 @@ class AdminAPI(api_tools.APIModeHandler):
         if data["plugins"]:
             project.plugins = data["plugins"]
         project.commit()
+        Project.invalidate_cache(project.id)
         return project.to_json(exclude_fields=Project.API_EXCLUDE_FIELDS), 200
 
     @auth.decorators.check_api({
@@ -143,26 +168,19 @@ class AdminAPI(api_tools.APIModeHandler):
         }})
     def delete(self, project_id: int):
         project = Project.query.get_or_404(project_id)
-        try:
-            system_user_id = get_project_user(project.id)['id']
-        except (RuntimeError, KeyError, NoResultFound):
-            system_user_id = None
-
-        context = {
-            'project': project,
-            'vault_client': VaultClient.from_project(project),
-            'system_user_id': system_user_id
-        }
-
-        statuses: List[dict] = []
-        for step in get_steps(self.module, reverse=True):
-            try:
-                step.delete(**context)
-            except Exception as e:
-                log.warning('%s error %s', repr(step), e)
-            statuses.append(step.status['deleted'])
-
-        return {'steps': statuses}, 200
+        if request.args.get("sync", default=False, type=lambda x: x.lower() in ("true", "1")):
+            statuses: List[dict] = delete_project(self.module, project).to_json()
+            return {'steps': statuses}, 200
+
+        def delete(job: ProjectJob) -> None:
+            project_to_delete = Project.query.get(project_id)
+            if not project_to_delete:
+                raise RuntimeError(f'Project {project_id} not found')
+            delete_project(self.module, project_to_delete, run=job.run)
+
+        job = ProjectJob(new_run(self.module, 'delete'), project_id=project.id)
+        self.module.project_jobs.submit(job, delete)
+        return job.to_json(), 202
 
 
 class API(api_tools.APIBase):  # pylint: disable=R0903
@@ -1,12 +1,10 @@
-import json
-
 from flask import request
 
-import redis
 from pylon.core.tools import web, log
-from tools import api_tools, constants as c
+from tools import api_tools
 
 from ...models.project import Project
+from ...utils import queue_registry
 
 
 class API(api_tools.APIBase):
@@ -25,14 +23,7 @@ class API(api_tools.APIBase):
 
     def put(self, vhost, **kwargs):
         log.info('PUT DATA %s', request.json)
-        _rc = redis.Redis(
-            host=c.REDIS_HOST, port=c.REDIS_PORT, db=c.REDIS_RABBIT_DB,
-            password=c.REDIS_PASSWORD, username=c.REDIS_USER
-        )
-        for k, v in request.json.items():
-            # self.module.update_rabbit_queues(k, json.dumps(v))
-            log.info('SETTING REDIS QUEUES FOR [%s], [%s]', k, v)
-            _rc.set(name=k, value=json.dumps(v))
+        queue_registry.set_queues(request.json)
         return None, 200
 
     def patch(self, **kwargs):
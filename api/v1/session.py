@@ -23,8 +23,10 @@ class API(Resource):
         if not project_id:
             project_id = SessionProject.get()
         if project_id:
-            project = Project.query.get_or_404(project_id, exclude_fields=Project.API_EXCLUDE_FIELDS)
-            return project.to_json(), 200
+            project = Project.list_projects(project_id=project_id)
+            if not project:
+                return {"message": "Project not found"}, 404
+            return project, 200
         return {"message": "No project selected in session"}, 404
 
     def post(self, project_id: int):
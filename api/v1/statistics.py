@@ -1,27 +1,63 @@
-from flask import make_response
-from flask_restful import Resource
+from typing import Optional
+
+from flask import make_response, request
 
 from ...models.statistics import Statistic
 from ...models.quota import ProjectQuota
+from ...utils.statistics import format_statistics, get_projects_statistics
 
-from tools import auth
+from tools import auth, api_tools
 
-class API(Resource):
-    url_params = [
-        '<int:project_id>',
-    ]
 
-    def __init__(self, module):
-        self.module = module
+def _get_fields() -> Optional[set]:
+    fields = request.args.get("fields")
+    return set(fields.split(",")) if fields else None
+
 
+def get_project_statistics(project_id: int):
+    fields = _get_fields()
+    statistic = Statistic.query.filter_by(project_id=project_id).first().to_json(fields=fields)
+    quota = ProjectQuota.query.filter_by(project_id=project_id).first().to_json()
+    return make_response(format_statistics(statistic, quota, fields), 200)
+
+
+class ProjectAPI(api_tools.APIModeHandler):
     @auth.decorators.check_api(["projects.projects.project.view"])
-    def get(self, project_id: int):
-        statistic = Statistic.query.filter_by(project_id=project_id).first().to_json()
-        quota = ProjectQuota.query.filter_by(project_id=project_id).first().to_json()
-        stats = {}
-        for each in ["performance_test_runs", "ui_performance_test_runs", "sast_scans", "dast_scans", "storage_space",
-                     "tasks_count", "tasks_executions"]:
-
-            stats[each] = {"current": statistic[each], "quota": quota[each]}
-        stats["data_retention_limit"] = {"current": 0, "quota": quota["data_retention_limit"]}
-        return make_response(stats, 200)
+    def get(self, project_id: Optional[int] = None, **kwargs):
+        if project_id is None:
+            return make_response({"message": "Specify project id"}, 400)
+        return get_project_statistics(project_id)
+
+
+class AdminAPI(api_tools.APIModeHandler):
+    @auth.decorators.check_api({
+        "permissions": ["projects.projects.project.view"],
+        "recommended_roles": {
+            "administration": {"admin": True, "viewer": True, "editor": True},
+        }})
+    def get(self, project_id: Optional[int] = None, **kwargs):
+        if project_id is not None:
+            return get_project_statistics(project_id)
+        # statistics of given projects or a page of all projects
+        project_ids = request.args.getlist("project_id", type=int) or None
+        stats = get_projects_statistics(
+            project_ids,
+            rpc_manager=self.module.context.rpc_manager,
+            limit_=request.args.get("limit", type=int),
+            offset_=request.args.get("offset", type=int),
+            fields=_get_fields(),
+        )
+        return make_response({str(k): v for k, v in stats.items()}, 200)
+
+
+class API(api_tools.APIBase):  # pylint: disable=R0903
+    url_params = [
+        "<int:project_id>",
+        "<string:mode>",
+        "<string:mode>/<int:project_id>",
+    ]
+
+    mode_handlers = {
+        'administration': AdminAPI,
+        'default': ProjectAPI,
+    }
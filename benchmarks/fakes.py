@@ -0,0 +1,597 @@
+""" Local stand-ins for pylon, the shared `tools` package and external services.
+
+Every call to a fake service sleeps for the configured latency and is counted as a round trip,
+db round trips are counted per executed statement.
+"""
+import importlib
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from queue import Empty
+
+SERVICES = ('db', 'rpc', 'vault', 'minio', 'rabbit', 'influx')
+
+
+class RoundTrips:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counter = Counter()
+        self.latency = dict.fromkeys(SERVICES, 0.0)  # seconds
+
+    def hit(self, service: str) -> None:
+        with self._lock:
+            self.counter[service] += 1
+        latency = self.latency.get(service)
+        if latency:
+            time.sleep(latency)
+
+    def snapshot(self) -> Counter:
+        with self._lock:
+            return Counter(self.counter)
+
+
+round_trips = RoundTrips()
+
+
+# pylon
+
+
+def _make_pylon() -> None:
+    pylon = types.ModuleType('pylon')
+    core = types.ModuleType('pylon.core')
+    core_tools = types.ModuleType('pylon.core.tools')
+
+    log = logging.getLogger('projects.benchmarks')
+    log.setLevel(logging.ERROR)
+
+    web = types.ModuleType('pylon.core.tools.web')
+
+    def rpc(name=None, proxy_name=None):
+        def decorator(func):
+            func._rpc_name = name or func.__name__
+            func._rpc_proxy_name = proxy_name
+            return func
+        return decorator
+
+    def event(name=None):
+        def decorator(func):
+            func._event_name = name
+            return func
+        return decorator
+
+    web.rpc = rpc
+    web.event = event
+
+    module = types.ModuleType('pylon.core.tools.module')
+
+    class ModuleModel:
+        ...
+
+    module.ModuleModel = ModuleModel
+
+    context = types.ModuleType('pylon.core.tools.context')
+
+    class Context:
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    context.Context = Context
+
+    core_tools.log = log
+    core_tools.web = web
+    core_tools.module = module
+    core_tools.context = context
+    pylon.core = core
+    core.tools = core_tools
+    sys.modules.update({
+        'pylon': pylon, 'pylon.core': core, 'pylon.core.tools': core_tools,
+        'pylon.core.tools.web': web, 'pylon.core.tools.module': module,
+        'pylon.core.tools.context': context,
+    })
+
+
+# rpc
+
+
+class FakeRpcManager:
+    def __init__(self):
+        self.handlers = {}
+
+    def register(self, name: str, func) -> None:
+        self.handlers[name] = func
+
+    def _invoke(self, name: str, timeout, *args, **kwargs):
+        round_trips.hit('rpc')
+        try:
+            handler = self.handlers[name]
+        except KeyError:
+            if timeout is not None:
+                # nobody answers, the caller waits for the whole timeout as with a real event node
+                time.sleep(timeout)
+                raise Empty(name)
+            raise RuntimeError(f'No rpc handler for {name}')
+        return handler(*args, **kwargs)
+
+    @property
+    def call(self) -> '_Caller':
+        return _Caller(self, None)
+
+    def timeout(self, seconds: float) -> '_Caller':
+        return _Caller(self, seconds)
+
+
+class _Caller:
+    def __init__(self, manager: FakeRpcManager, timeout):
+        self._manager = manager
+        self._timeout = timeout
+
+    def __getattr__(self, name: str):
+        def call(*args, **kwargs):
+            return self._manager._invoke(name, self._timeout, *args, **kwargs)
+        return call
+
+
+class FakeEventManager:
+    def fire_event(self, name: str, payload=None) -> None:
+        ...
+
+
+rpc_manager = FakeRpcManager()
+
+
+class FakeAdmin:
+    """ Memberships, roles and permissions normally kept by admin plugin """
+
+    def __init__(self, batch_rpcs: bool = True):
+        self.members = defaultdict(set)
+        self.roles = defaultdict(set)
+        self.permissions = defaultdict(set)
+        self.tasks = defaultdict(int)
+        handlers = {
+            'admin_check_user_in_project': lambda project_id, user_id: user_id in self.members[project_id],
+            'admin_get_users_ids_in_project': lambda project_id: list(self.members[project_id]),
+            'admin_add_user_to_project': lambda project_id, user_id, roles: self.members[project_id].add(user_id),
+            'admin_add_role': lambda project_id, roles: self.roles[project_id].update(roles),
+            'admin_set_permission_for_role': lambda project_id, role, permission: self.permissions[
+                project_id].add((role, permission)),
+            'admin_get_user_roles': lambda project_id, user_id: [{'name': i} for i in self.roles[project_id]],
+            'tasks_count': lambda project_id: self.tasks[project_id],
+            'auth_manager_get_token': lambda: 'keycloak-token',
+            'auth_manager_create_user_representation': lambda user_data: user_data,
+            'auth_manager_post_user': lambda realm, token, entity: None,
+            'auth_get_token': lambda token_id: {'user_id': token_id},
+            'auth_get_user': lambda user_id: auth.get_user(user_id=user_id),
+            'scheduling_create_if_not_exists': lambda data: None,
+        }
+        if batch_rpcs:
+            handlers.update({
+                'admin_get_user_project_ids': lambda user_id: [
+                    project_id for project_id, users in self.members.items() if user_id in users
+                ],
+                'admin_add_users_to_project': lambda project_id, user_ids, roles: self.members[
+                    project_id].update(user_ids),
+                'admin_set_permissions_for_roles': lambda project_id, matrix: self.permissions[project_id].update(
+                    (role, permission) for role, permissions in matrix.items() for permission in permissions
+                ),
+                'tasks_count_by_projects': lambda project_ids: {i: self.tasks[i] for i in project_ids},
+                'auth_get_tokens': lambda token_ids: [{'user_id': i} for i in token_ids],
+                'admin_get_batch_rpcs': lambda: ['admin_add_users_to_project', 'admin_set_permissions_for_roles'],
+            })
+        for name, handler in handlers.items():
+            rpc_manager.register(name, handler)
+
+
+# services
+
+
+class FakeMinioClient:
+    files_per_bucket = 100
+    file_size = 1_000_000
+    page_size = 1000
+
+    def __init__(self, project=None, **kwargs):
+        self.project = project
+
+    def list_bucket(self) -> list:
+        round_trips.hit('minio')
+        return ['reports', 'tasks']
+
+    def list_files(self, bucket: str) -> list:
+        for _ in range(max(1, -(-self.files_per_bucket // self.page_size))):
+            round_trips.hit('minio')
+        return [{'name': f'file_{i}', 'size': self.file_size} for i in range(self.files_per_bucket)]
+
+    def create_bucket(self, bucket: str, bucket_type=None) -> None:
+        round_trips.hit('minio')
+
+    def remove_bucket(self, bucket: str) -> None:
+        round_trips.hit('minio')
+
+
+class _VaultSpace:
+    def __init__(self, project_id):
+        self.project_id = project_id
+
+    def dict(self, by_alias: bool = False) -> dict:
+        return {'auth': {'project_id': self.project_id}}
+
+
+class FakeVaultClient:
+    global_secrets = {
+        'rabbit_user': 'admin', 'rabbit_password': 'password',
+        'influx_ip': 'influx', 'influx_port': 8086, 'influx_user': '', 'influx_password': '',
+    }
+    secrets = defaultdict(dict)
+    hidden_secrets = defaultdict(dict)
+
+    def __init__(self, project=None, **kwargs):
+        self.project_id = getattr(project, 'id', project)
+
+    @classmethod
+    def from_project(cls, project) -> 'FakeVaultClient':
+        return cls(project)
+
+    def get_all_secrets(self) -> dict:
+        round_trips.hit('vault')
+        result = dict(self.global_secrets)
+        if self.project_id is not None:
+            result.update(self.hidden_secrets[self.project_id])
+            result.update(self.secrets[self.project_id])
+        return result
+
+    def get_secrets(self) -> dict:
+        round_trips.hit('vault')
+        return dict(self.secrets[self.project_id])
+
+    def set_secrets(self, secrets: dict) -> None:
+        round_trips.hit('vault')
+        self.secrets[self.project_id] = dict(secrets)
+
+    def set_hidden_secrets(self, secrets: dict) -> None:
+        round_trips.hit('vault')
+        self.hidden_secrets[self.project_id] = dict(secrets)
+
+    def create_project_space(self) -> _VaultSpace:
+        round_trips.hit('vault')
+        return _VaultSpace(self.project_id)
+
+    def remove_project_space(self) -> None:
+        round_trips.hit('vault')
+        self.secrets.pop(self.project_id, None)
+        self.hidden_secrets.pop(self.project_id, None)
+
+
+class FakeInfluxDBClient:
+    def __init__(self, *args, **kwargs):
+        ...
+
+    def query(self, *args, **kwargs) -> list:
+        round_trips.hit('influx')
+        return []
+
+
+class FakeRabbitAdminAPI:
+    def __init__(self, url=None, auth=None):
+        ...
+
+    def __getattr__(self, name: str):
+        def call(*args, **kwargs):
+            round_trips.hit('rabbit')
+            return []
+        return call
+
+
+class FakeAuth(types.ModuleType):
+    def __init__(self):
+        super().__init__('tools.auth')
+        self.users = {}
+        self.tokens = defaultdict(list)
+        self.permissions_count = 300
+        self.decorators = types.SimpleNamespace(check_api=lambda *a, **kw: (lambda func: func))
+
+    def list_users(self) -> list:
+        return list(self.users.values())
+
+    def get_user(self, user_id=None, email=None) -> dict:
+        if user_id is not None and user_id in self.users:
+            return self.users[user_id]
+        for user in self.users.values():
+            if email is not None and user['email'] == email:
+                return user
+        raise RuntimeError('User not found')
+
+    def add_user(self, email: str, name: str = '') -> int:
+        user_id = len(self.users) + 1
+        self.users[user_id] = {'id': user_id, 'email': email, 'name': name}
+        return user_id
+
+    def add_user_provider(self, *args, **kwargs) -> None:
+        ...
+
+    def add_user_group(self, *args, **kwargs) -> None:
+        ...
+
+    def assign_user_to_role(self, *args, **kwargs) -> None:
+        ...
+
+    def delete_user(self, user_id: int) -> None:
+        self.users.pop(user_id, None)
+
+    def list_tokens(self, user_id: int) -> list:
+        return [{'id': i} for i in self.tokens[user_id]]
+
+    def add_token(self, user_id: int, name: str, **kwargs) -> int:
+        token_id = sum(len(i) for i in self.tokens.values()) + 1
+        self.tokens[user_id].append(token_id)
+        return token_id
+
+    def encode_token(self, token_id: int) -> str:
+        return f'token-{token_id}'
+
+    def delete_token(self, token_id: int) -> None:
+        ...
+
+    def get_roles(self, mode: str = 'default') -> list:
+        return [{'name': i} for i in ('admin', 'editor', 'viewer', 'system')]
+
+    def get_permissions(self, mode: str = 'default') -> list:
+        return [
+            {'name': role, 'permission': f'plugin.permission.{i}'}
+            for i in range(self.permissions_count) for role in ('admin', 'editor')
+        ]
+
+    def current_user(self) -> dict:
+        return {}
+
+
+auth = FakeAuth()
+
+
+# db
+
+
+def _make_db(uri: str) -> types.ModuleType:
+    import sqlalchemy
+    from sqlalchemy import create_engine, event, text, MetaData
+    from sqlalchemy.orm import declarative_base, scoped_session, sessionmaker, Query
+
+    is_sqlite = uri.startswith('sqlite')
+    if is_sqlite:
+        # postgres ARRAY columns are stored as JSON in sqlite
+        sqlalchemy.ARRAY = lambda *args, **kwargs: sqlalchemy.JSON()
+        engine = create_engine(uri, connect_args={'check_same_thread': False, 'timeout': 60})
+
+        @event.listens_for(engine, 'connect')
+        def _sqlite_functions(dbapi_connection, connection_record):
+            dbapi_connection.create_function('greatest', -1, lambda *args: max(args))
+            dbapi_connection.execute('PRAGMA journal_mode=WAL')
+    else:
+        engine = create_engine(uri)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        round_trips.hit('db')
+
+    class BaseQuery(Query):
+        def get_or_404(self, ident, **kwargs):
+            obj = self.get(ident)
+            if obj is None:
+                from werkzeug.exceptions import NotFound
+                raise NotFound()
+            return obj
+
+    session = scoped_session(sessionmaker(bind=engine, query_cls=BaseQuery))
+    Base = declarative_base()
+    Base.query = session.query_property(query_cls=BaseQuery)
+    tenant_metadata = MetaData()
+
+    class FakeTenantSession:
+        def __init__(self):
+            self._connection = None
+
+        def execute(self, statement, *args, **kwargs) -> None:
+            round_trips.hit('db')
+
+        def connection(self):
+            if self._connection is None:
+                self._connection = create_engine('sqlite://').connect()
+            return self._connection
+
+        def commit(self) -> None:
+            round_trips.hit('db')
+
+    @contextmanager
+    def with_project_schema_session(project_id: int):
+        tenant_session = FakeTenantSession()
+        try:
+            yield tenant_session
+        finally:
+            if tenant_session._connection is not None:
+                tenant_session._connection.close()
+
+    db = types.ModuleType('tools.db')
+    db.engine = engine
+    db.session = session
+    db.Base = Base
+    db.is_sqlite = is_sqlite
+    db.get_shared_metadata = lambda: Base.metadata
+    db.get_all_metadata = lambda: tenant_metadata
+    db.with_project_schema_session = with_project_schema_session
+    db.utcnow_default = text('CURRENT_TIMESTAMP')
+    return db
+
+
+def _make_tools(db: types.ModuleType) -> types.ModuleType:
+    tools = types.ModuleType('tools')
+
+    db_tools = types.ModuleType('tools.db_tools')
+
+    class AbstractBaseMixin:
+        __table__ = None
+
+        def to_json(self, exclude_fields: tuple = ()) -> dict:
+            return {
+                c.name: getattr(self, c.key) for c in self.__table__.columns if c.name not in exclude_fields
+            }
+
+        def insert(self) -> None:
+            db.session.add(self)
+            db.session.commit()
+
+        @staticmethod
+        def commit() -> None:
+            db.session.commit()
+
+        def delete(self, commit: bool = True) -> None:
+            db.session.delete(self)
+            if commit:
+                db.session.commit()
+
+    db_tools.AbstractBaseMixin = AbstractBaseMixin
+
+    rpc_tools = types.ModuleType('tools.rpc_tools')
+    rpc_tools.wrap_exceptions = lambda exception: (lambda func: func)
+
+    class RpcMixin:
+        @property
+        def rpc(self) -> FakeRpcManager:
+            return rpc_manager
+
+    rpc_tools.RpcMixin = RpcMixin
+
+    data_tools = types.ModuleType('tools.data_tools')
+    data_tools.utcnow = lambda: db.utcnow_default
+
+    api_tools = types.ModuleType('tools.api_tools')
+
+    class APIBase:
+        url_params = []
+        mode_handlers = {}
+
+        def __init__(self, module):
+            self.module = module
+
+    class APIModeHandler:
+        def __init__(self, module):
+            self.module = module
+
+    api_tools.APIBase = APIBase
+    api_tools.APIModeHandler = APIModeHandler
+
+    config = types.SimpleNamespace(
+        PROJECT_CACHE_KEY='project_id', PROJECT_CACHE_PLUGINS='project_plugins', DATABASE_URI=str(db.engine.url)
+    )
+    constants = types.SimpleNamespace(
+        REDIS_HOST='localhost', REDIS_PORT=6379, REDIS_RABBIT_DB=0, REDIS_PASSWORD=None, REDIS_USER=None,
+        DEFAULT_MODE='default', BACKEND_PERFORMANCE_RESULTS_RETENTION=30,
+    )
+
+    class TaskManager:
+        def __init__(self, *args, **kwargs):
+            ...
+
+        def run_task(self, *args, **kwargs) -> None:
+            round_trips.hit('rpc')
+
+    tools.db = db
+    tools.db_tools = db_tools
+    tools.rpc_tools = rpc_tools
+    tools.data_tools = data_tools
+    tools.api_tools = api_tools
+    tools.config = config
+    tools.constants = constants
+    tools.auth = auth
+    tools.MinioClient = FakeMinioClient
+    tools.VaultClient = FakeVaultClient
+    tools.TaskManager = TaskManager
+    tools.db_migrations = types.SimpleNamespace(run_db_migrations=lambda *args, **kwargs: None)
+    sys.modules.update({
+        'tools': tools, 'tools.db': db, 'tools.db_tools': db_tools, 'tools.rpc_tools': rpc_tools,
+        'tools.data_tools': data_tools, 'tools.api_tools': api_tools, 'tools.auth': auth,
+    })
+    return tools
+
+
+def _make_services() -> None:
+    influxdb = types.ModuleType('influxdb')
+    influxdb.InfluxDBClient = FakeInfluxDBClient
+    rabbitmq_admin = types.ModuleType('rabbitmq_admin')
+    rabbitmq_admin.AdminAPI = FakeRabbitAdminAPI
+    sys.modules.update({'influxdb': influxdb, 'rabbitmq_admin': rabbitmq_admin})
+    try:
+        import redis  # noqa: F401
+    except ImportError:
+        redis = types.ModuleType('redis')
+        redis.ResponseError = type('ResponseError', (Exception,), {})
+        redis.ConnectionPool = redis.Redis = lambda *args, **kwargs: None
+        sys.modules['redis'] = redis
+
+
+# plugin
+
+
+class FakeModule:
+    """ Stands in for pylon module: plugin rpc functions are bound to it by their proxy names """
+
+    def __init__(self, rpc_classes: list):
+        from pylon.core.tools.context import Context
+        self.context = Context(rpc_manager=rpc_manager, event_manager=FakeEventManager())
+        self.visitors = defaultdict(dict)
+        self.rabbit_reconciliation = {}
+        self.statistics_aggregator = None
+        self.project_jobs = None
+        self.project_pool = None
+        for rpc_class in rpc_classes:
+            for func in vars(rpc_class).values():
+                if not hasattr(func, '_rpc_name'):
+                    continue
+                bound = types.MethodType(func, self)
+                if func._rpc_proxy_name:
+                    setattr(self, func._rpc_proxy_name, bound)
+                rpc_manager.register(func._rpc_name, bound)
+
+
+def load_plugin(db_uri: str = None, package_name: str = 'projects') -> types.SimpleNamespace:
+    """ Installs fakes and imports the plugin package from repository root under package_name """
+    if db_uri is None:
+        db_uri = os.environ.get(
+            'BENCH_DB_URI', f'sqlite:///{tempfile.mkdtemp(prefix="projects_bench_")}/bench.sqlite'
+        )
+    _make_pylon()
+    db = _make_db(db_uri)
+    _make_tools(db)
+    _make_services()
+
+    root = Path(__file__).resolve().parents[1]
+    package = types.ModuleType(package_name)
+    package.__path__ = [str(root)]
+    sys.modules[package_name] = package
+
+    def load(name: str):
+        return importlib.import_module(f'{package_name}.{name}')
+
+    plugin = types.SimpleNamespace(
+        db=db,
+        project=load('models.project'),
+        quota=load('models.quota'),
+        statistics=load('models.statistics'),
+        storage_usage=load('models.storage_usage'),
+        pd=load('models.pd.project'),
+        project_steps=load('utils.project_steps'),
+        project_pool=load('utils.project_pool'),
+        rpc_main=load('rpc.main'),
+        rpc_poc=load('rpc.poc'),
+        rpc_storage=load('rpc.storage'),
+    )
+    if db.is_sqlite:
+        from sqlalchemy.dialects.sqlite import insert
+        plugin.storage_usage.insert = insert
+    load('init_db').init_db()
+    return plugin
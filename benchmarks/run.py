@@ -0,0 +1,218 @@
+""" Benchmarks project lifecycle hot paths against local fakes.
+
+    python -m benchmarks.run --projects 10,1000,50000 --latency rpc=1 --latency vault=2
+
+Reports latency percentiles and round trips per operation to every external service.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+from .fakes import SERVICES, FakeAdmin, FakeMinioClient, FakeModule, auth, load_plugin, round_trips
+
+BENCH_USER_EMAIL = 'bench@example.com'
+MEMBERSHIP_EVERY = 10
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def measure(name: str, func, iterations: int) -> dict:
+    timings = []
+    trips = Counter()
+    for i in range(iterations):
+        before = round_trips.snapshot()
+        started = time.perf_counter()
+        func(i)
+        timings.append((time.perf_counter() - started) * 1000)
+        trips.update(round_trips.snapshot() - before)
+    return {
+        'scenario': name,
+        'iterations': iterations,
+        'p50_ms': percentile(timings, 50),
+        'p90_ms': percentile(timings, 90),
+        'p99_ms': percentile(timings, 99),
+        'mean_ms': statistics.fmean(timings),
+        'round_trips': {service: trips[service] / iterations for service in SERVICES},
+    }
+
+
+class Seeder:
+    """ Grows the database to requested number of projects with bulk inserts """
+
+    def __init__(self, plugin, admin: FakeAdmin, user_id: int):
+        self.plugin = plugin
+        self.admin = admin
+        self.user_id = user_id
+        self.project_ids = []
+
+    def grow(self, count: int, chunk: int = 5000) -> None:
+        db = self.plugin.db
+        Project = self.plugin.project.Project
+        ProjectQuota = self.plugin.quota.ProjectQuota
+        Statistic = self.plugin.statistics.Statistic
+        StorageUsage = self.plugin.storage_usage.StorageUsage
+        while len(self.project_ids) < count:
+            start = len(self.project_ids)
+            size = min(chunk, count - start)
+            with db.engine.begin() as connection:
+                result = connection.execute(Project.__table__.insert().returning(Project.__table__.c.id), [
+                    {
+                        'name': f'project_{start + i}', 'owner_id': self.user_id, 'plugins': ['backend_performance'],
+                        'secrets_json': {}, 'create_success': True
+                    } for i in range(size)
+                ])
+                ids = [row[0] for row in result]
+                now = datetime.utcnow()
+                connection.execute(ProjectQuota.__table__.insert(), [
+                    {
+                        'project_id': i, 'data_retention_limit': 1_000_000_000, 'dast_scans': 100,
+                        'sast_scans': -1, 'vcu_hard_limit': 5000, 'vcu_soft_limit': 4700,
+                        'storage_hard_limit': 10, 'storage_soft_limit': 9, 'last_update_time': now,
+                        'vcu_limit_total_block': False, 'storage_limit_total_block': False,
+                    } for i in ids
+                ])
+                connection.execute(Statistic.__table__.insert(), [
+                    dict({column: 0 for column in Statistic.COUNTER_COLUMNS}, project_id=i, start_time=now)
+                    for i in ids
+                ])
+                connection.execute(StorageUsage.__table__.insert(), [
+                    {'project_id': i, 'bucket': bucket, 'size': 1_000_000, 'updated_at': now}
+                    for i in ids for bucket in ('reports', 'tasks')
+                ])
+            for project_id in ids[::MEMBERSHIP_EVERY]:
+                self.admin.members[project_id].add(self.user_id)
+            self.project_ids.extend(ids)
+
+
+def run(args) -> list:
+    for item in args.latency:
+        service, _, value = item.partition('=')
+        if service not in SERVICES:
+            raise SystemExit(f'Unknown service {service}, expected one of {SERVICES}')
+        round_trips.latency[service] = float(value) / 1000
+    FakeMinioClient.files_per_bucket = args.files_per_bucket
+    auth.permissions_count = args.permissions
+
+    plugin = load_plugin(args.db)
+    admin = FakeAdmin(batch_rpcs=not args.no_batch_rpcs)
+    module = FakeModule([plugin.rpc_main.RPC, plugin.rpc_poc.RPC, plugin.rpc_storage.RPC])
+    user_id = auth.add_user(BENCH_USER_EMAIL, 'bench')
+    seeder = Seeder(plugin, admin, user_id)
+    session = plugin.db.session
+    Statistic = plugin.statistics.Statistic
+    rng = random.Random(args.seed)
+
+    def random_project_id(_) -> int:
+        return rng.choice(seeder.project_ids)
+
+    def list_user_projects(_) -> None:
+        module.list_user_projects(user_id, limit_=20, offset_=0)
+
+    def check_quota(i) -> None:
+        plugin.quota.ProjectQuota.check_quota(random_project_id(i), 'dast_scans')
+
+    def check_storage_quota(i) -> None:
+        plugin.quota.ProjectQuota.check_quota(random_project_id(i), 'storage_space')
+
+    def increment_statistics(i) -> None:
+        module.increment_statistics(random_project_id(i), 'tasks_executions')
+
+    def statistic_to_json(i) -> None:
+        Statistic.query.filter(Statistic.project_id == random_project_id(i)).first().to_json()
+
+    def create_project(i) -> None:
+        project_model = plugin.pd.ProjectCreatePD(
+            name=f'bench_created_{len(seeder.project_ids)}_{i}', project_admin_email=BENCH_USER_EMAIL
+        )
+        plugin.project_steps.create_project(module, {
+            'project_model': project_model,
+            'owner_id': user_id,
+            'roles': ['admin'],
+        }, max_workers=args.workers)
+
+    pool = plugin.project_pool.ProjectPool(module, size=args.create_iterations, interval=0)
+
+    def create_project_pooled(i) -> None:
+        module.project_pool = pool
+        try:
+            create_project(i)
+        finally:
+            module.project_pool = None
+
+    def fill_pool() -> None:
+        pool.fill()
+        session.remove()
+
+    scenarios = [
+        ('list_user_projects', list_user_projects, args.iterations),
+        ('check_quota', check_quota, args.iterations),
+        ('check_quota_storage', check_storage_quota, args.iterations),
+        ('increment_statistics', increment_statistics, args.iterations),
+        ('statistic_to_json', statistic_to_json, args.iterations),
+        ('create_project', create_project, args.create_iterations),
+        ('create_project_pooled', create_project_pooled, args.create_iterations),
+    ]
+    prepare = {'create_project_pooled': fill_pool}
+    results = []
+    for count in sorted(args.projects):
+        seeder.grow(count)
+        for name, func, iterations in scenarios:
+            if args.only and name not in args.only:
+                continue
+            if name in prepare:
+                prepare[name]()
+            result = measure(name, func, iterations)
+            result['projects'] = count
+            results.append(result)
+            session.remove()
+            print(format_result(result), file=sys.stderr, flush=True)
+    return results
+
+
+def format_result(result: dict) -> str:
+    trips = ' '.join(f'{service}={result["round_trips"][service]:g}' for service in SERVICES)
+    return (
+        f'{result["projects"]:>7} {result["scenario"]:<22} n={result["iterations"]:<5} '
+        f'p50={result["p50_ms"]:8.2f}ms p90={result["p90_ms"]:8.2f}ms p99={result["p99_ms"]:8.2f}ms '
+        f'| {trips}'
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--projects', type=lambda v: [int(i) for i in v.split(',')],
+                        default=[10, 100, 1000, 10000, 50000], help='comma separated project counts')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--create-iterations', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4, help='project creation workers')
+    parser.add_argument('--latency', action='append', default=[], metavar='SERVICE=MS',
+                        help=f'simulated latency per round trip, services: {", ".join(SERVICES)}')
+    parser.add_argument('--files-per-bucket', type=int, default=100)
+    parser.add_argument('--permissions', type=int, default=300, help='permissions per role set on creation')
+    parser.add_argument('--no-batch-rpcs', action='store_true',
+                        help='do not register batch rpcs of admin plugin to measure per-item fallbacks')
+    parser.add_argument('--only', action='append', help='run only named scenarios')
+    parser.add_argument('--db', help='sqlalchemy uri, temporary sqlite file by default')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write results as json to the file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(results, out, indent=2)
+
+
+if __name__ == '__main__':
+    main()
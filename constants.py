@@ -10,3 +10,26 @@ PROJECT_SCHEMA_TEMPLATE = 'p_{}'
 PROJECT_RABBIT_USER_TEMPLATE = 'rabbit_user_{}'
 PROJECT_RABBIT_VHOST_TEMPLATE = 'project_{}_vhost'
 PROJECT_PERSONAL_NAME_TEMPLATE = 'project_user_{user_id}'
+PROJECT_CACHE_MAXSIZE = 1024
+PROJECT_CACHE_TTL = 60  # seconds
+PROJECT_CREATION_WORKERS = 4
+RABBIT_ADMIN_URL = 'http://carrier-rabbit:15672'
+RABBIT_RECONCILE_WORKERS = 8
+USERS_INDEX_TTL = 300  # seconds
+STATISTICS_FLUSH_INTERVAL = 2  # seconds
+QUOTA_PERIOD_SECONDS = 2592000  # 30 days
+INFLUX_CLIENTS_CACHE_SIZE = 256
+INFLUX_CLIENTS_CACHE_TTL = 3600  # seconds
+SECRETS_CACHE_SIZE = 1024
+SECRETS_CACHE_TTL = 300  # seconds
+PROJECT_JOBS_WORKERS = 2
+PROJECT_JOBS_HISTORY_SIZE = 1000
+PROJECT_JOBS_HISTORY_TTL = 86400  # seconds
+STEP_DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # seconds
+PROJECT_POOL_SIZE = 0  # pre-provisioned projects kept in the warm pool, 0 disables it
+PROJECT_POOL_FILL_INTERVAL = 60  # seconds
+PROJECT_POOL_NAME_TEMPLATE = '_pool_{}'
+PROJECT_POOL_LOCK_ID = 7_403_221  # postgres advisory lock held while filling the pool
+BATCH_RPC_PROBE_TIMEOUT = 2  # seconds to wait for an optional batch rpc not known to exist yet
+BATCH_RPC_RECHECK_INTERVAL = 600  # seconds a missing batch rpc is skipped before it is probed again
+ADMIN_BATCH_RPCS_PROBE = 'admin_get_batch_rpcs'  # read-only rpc listing batch write rpcs of admin plugin
@@ -0,0 +1,59 @@
+# !/usr/bin/python3
+# coding=utf-8
+
+#   Copyright 2022 getcarrier.io
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# """ DB migration """
+
+revision = "202610181200"
+down_revision = "202308011522"
+branch_labels = None
+
+
+from alembic import op
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from pylon.core.tools import log
+
+
+table_name = "project"
+index_name = "ix_project_name_trgm"
+
+
+def _ensure_pg_trgm(bind) -> bool:
+    """ Installing the extension needs privileges the app role may not have, the index is optional """
+    if bind.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar():
+        return True
+    try:
+        with bind.begin_nested():
+            bind.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except DBAPIError as e:
+        log.warning("pg_trgm is not available, skipping %s: %s", index_name, e)
+        return False
+    return True
+
+
+def upgrade(module, payload):
+    if not _ensure_pg_trgm(op.get_bind()):
+        return
+    op.create_index(
+        index_name, table_name, ["name"],
+        postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}
+    )
+
+
+def downgrade(module, payload):
+    op.execute(f"DROP INDEX IF EXISTS {index_name}")
@@ -5,6 +5,7 @@ def init_db():
     from .models.project import Project
     from .models.quota import ProjectQuota
     from .models.statistics import Statistic
+    from .models.storage_usage import StorageUsage
 
     db.get_shared_metadata().create_all(bind=db.engine)
 
@@ -11,17 +11,23 @@
 #     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #     See the License for the specific language governing permissions and
 #     limitations under the License.
-from typing import Optional
-from sqlalchemy import String, Column, Integer, JSON, ARRAY, Text, and_, Boolean
+from copy import deepcopy
+from typing import Iterable, Optional
+from sqlalchemy import String, Column, Integer, JSON, ARRAY, Text, Boolean, update, false
 from sqlalchemy.ext.mutable import MutableDict
 
 from tools import rpc_tools, db, db_tools, MinioClient
 
+from ..constants import PROJECT_CACHE_MAXSIZE, PROJECT_CACHE_TTL
+from ..utils.cache import TTLCache
+
+project_cache = TTLCache(maxsize=PROJECT_CACHE_MAXSIZE, ttl=PROJECT_CACHE_TTL)
+
 
 class Project(db_tools.AbstractBaseMixin, rpc_tools.RpcMixin, db.Base):
     __tablename__ = "project"
 
-    API_EXCLUDE_FIELDS = ("secrets_json",)
+    API_EXCLUDE_FIELDS = ("secrets_json", "pooled")
 
     id = Column(Integer, primary_key=True)
     name = Column(String(256), nullable=False)
@@ -34,6 +40,34 @@ class Project(db_tools.AbstractBaseMixin, rpc_tools.RpcMixin, db.Base):
         nullable=False, default={},
     )
     create_success = Column(Boolean, nullable=False, default=False)
+    # pre-provisioned project waiting in the warm pool to be claimed
+    pooled = Column(Boolean, nullable=False, default=False, server_default=false())
+
+    @staticmethod
+    def get_cached(project_id: int) -> Optional[dict]:
+        """ Column values of the project for read-only use, hitting db only on cache miss.
+        Callers which change the project must load it with Project.query instead """
+        if not project_id:
+            return None
+        values = project_cache.get(project_id)
+        if values is None:
+            project = Project.query.filter(Project.id == project_id, Project.pooled.is_(False)).first()
+            if not project:
+                return None
+            values = {c.name: getattr(project, c.name) for c in Project.__table__.columns}
+            project_cache.set(project_id, deepcopy(values))
+        return deepcopy(values)
+
+    def snapshot(self) -> 'Project':
+        """ Detached copy of the project which is safe to read outside of the db session """
+        return Project(**deepcopy({c.name: getattr(self, c.name) for c in Project.__table__.columns}))
+
+    @staticmethod
+    def invalidate_cache(project_id: Optional[int] = None) -> None:
+        if project_id is None:
+            project_cache.clear()
+        else:
+            project_cache.invalidate(project_id)
 
     def get_data_retention_limit(self) -> Optional[int]:
         from .quota import ProjectQuota
@@ -48,23 +82,81 @@ class Project(db_tools.AbstractBaseMixin, rpc_tools.RpcMixin, db.Base):
         if project_quota:
             return project_quota.storage_soft_limit_in_bytes, project_quota.storage_hard_limit_in_bytes
 
+    @staticmethod
+    def api_columns(fields: Optional[Iterable[str]] = None) -> list:
+        """ Columns returned by api, optionally narrowed to sparse fields (id is always included) """
+        columns = [c for c in Project.__table__.columns if c.name not in Project.API_EXCLUDE_FIELDS]
+        if fields is not None:
+            fields = set(fields)
+            columns = [c for c in columns if c.name in fields or c.name == 'id']
+        return columns
+
     @staticmethod
     def list_projects(project_id: int = None, search_: str = None,
-                      limit_: int = None, offset_: int = None, **kwargs) -> dict | list[dict] | None:
-        _filter = None
+                      limit_: int = None, offset_: int = None,
+                      project_ids: Optional[list[int]] = None,
+                      after_id: Optional[int] = None, with_total: bool = False,
+                      fields: Optional[Iterable[str]] = None,
+                      **kwargs) -> dict | list[dict] | None:
+        """ after_id gives keyset pagination on id, with_total wraps rows with total count and next cursor.
+        Only returned columns are fetched, without hydrating orm objects """
+        columns = Project.api_columns(fields)
         if project_id:
-            project = Project.query.get(project_id)
+            project = db.session.query(*columns).filter(
+                Project.id == project_id, Project.pooled.is_(False)
+            ).first()
             if not project:
                 return
-            return project.to_json(exclude_fields=Project.API_EXCLUDE_FIELDS)
-        elif search_:
-            filter_ = Project.name.ilike(f"%{search_}%")
-            if _filter is not None:
-                filter_ = and_(_filter, filter_)
-            projects = Project.query.filter(filter_).limit(limit_).offset(offset_).all()
-        else:
-            if _filter is not None:
-                projects = Project.query.filter(_filter).limit(limit_).offset(offset_).all()
-            else:
-                projects = Project.query.limit(limit_).offset(offset_).all()
-        return [project.to_json(exclude_fields=Project.API_EXCLUDE_FIELDS) for project in projects]
+            return dict(project._mapping)
+        filters = [Project.pooled.is_(False)]
+        if project_ids is not None:
+            filters.append(Project.id.in_(project_ids))
+        if search_:
+            # backed by trigram index on project.name
+            filters.append(Project.name.ilike(f"%{search_}%"))
+        query = db.session.query(*columns).filter(*filters)
+        total = query.count() if with_total else None
+        if after_id is not None:
+            query = query.filter(Project.id > after_id)
+        projects = query.order_by(Project.id).limit(limit_).offset(offset_).all()
+        rows = [dict(project._mapping) for project in projects]
+        if with_total:
+            return Project.paginate_result(rows, total, limit_)
+        return rows
+
+    @staticmethod
+    def count_pooled(ready_only: bool = False) -> int:
+        query = Project.query.filter(Project.pooled.is_(True))
+        if ready_only:
+            query = query.filter(Project.create_success.is_(True))
+        return query.count()
+
+    @staticmethod
+    def get_stale_pooled() -> list['Project']:
+        """ Pooled projects left half-provisioned by a failed fill whose cleanup did not finish """
+        return Project.query.filter(Project.pooled.is_(True), Project.create_success.is_(False)).all()
+
+    @staticmethod
+    def claim_pooled(name: str, owner_id: int, plugins: list) -> Optional[int]:
+        """ Atomically takes one ready project out of the warm pool, concurrent claims skip locked rows.
+        Returns id of the claimed project or None if the pool is empty """
+        table = Project.__table__
+        candidate = db.session.query(Project.id).filter(
+            Project.pooled.is_(True), Project.create_success.is_(True)
+        ).order_by(Project.id).limit(1).with_for_update(skip_locked=True).scalar_subquery()
+        project_id = db.session.execute(
+            update(table).where(
+                table.c.id == candidate, table.c.pooled.is_(True)
+            ).values(
+                name=name, owner_id=owner_id, plugins=plugins, pooled=False
+            ).returning(table.c.id)
+        ).scalar()
+        db.session.commit()
+        return project_id
+
+    @staticmethod
+    def paginate_result(rows: list[dict], total: int, limit_: Optional[int] = None) -> dict:
+        next_after_id = None
+        if limit_ and rows and len(rows) >= int(limit_):
+            next_after_id = rows[-1]['id']
+        return {'total': total, 'rows': rows, 'next_after_id': next_after_id}
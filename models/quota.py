@@ -12,13 +12,15 @@
 #     See the License for the specific language governing permissions and
 #     limitations under the License.
 
-from sqlalchemy import Column, Integer, DateTime, Boolean
+from sqlalchemy import Column, Integer, DateTime, Boolean, update, func, literal, cast
 from datetime import datetime, timedelta
 
 from tools import db, db_tools, data_tools
 
 from typing_extensions import Optional
+from ..constants import QUOTA_PERIOD_SECONDS
 from .statistics import Statistic
+from .storage_usage import StorageUsage
 
 
 class ProjectQuota(db_tools.AbstractBaseMixin, db.Base):
@@ -61,36 +63,72 @@ class ProjectQuota(db_tools.AbstractBaseMixin, db.Base):
         self.storage_limit_total_block = storage_limit_total_block
         self.commit()
 
-    @classmethod
-    def update_time(cls, project_quota) -> bool:
-        if not project_quota.last_update_time:
-            project_quota.last_update_time = datetime.utcnow()
-            project_quota.commit()
-            return True
-        if (datetime.utcnow() - project_quota.last_update_time).total_seconds() > 2592000:
-            project_quota.last_update_time = project_quota.last_update_time + timedelta(seconds=2592000)
-            statistic = Statistic.query.filter_by(project_id=project_quota.project_id).first()
-            statistic.vuh_used = 0
-            statistic.dast_scans = 0
-            statistic.sast_scans = 0
-            statistic.performance_test_runs = 0
-            statistic.ui_performance_test_runs = 0
-            statistic.commit()
-            return True
-        return False
+    @staticmethod
+    def rollover_due_periods() -> int:
+        """ Resets statistic counters of every project whose quota period has expired
+        and moves period start into the current period. Returns number of rolled over projects """
+        now = datetime.utcnow()
+        period = timedelta(seconds=QUOTA_PERIOD_SECONDS)
+        quota_table = ProjectQuota.__table__
+        statistic_table = Statistic.__table__
+
+        db.session.execute(
+            update(quota_table).where(
+                quota_table.c.last_update_time.is_(None)
+            ).values(last_update_time=now)
+        )
+        periods = func.floor(
+            func.extract('epoch', literal(now) - quota_table.c.last_update_time) / QUOTA_PERIOD_SECONDS
+        )
+        due = update(quota_table).where(
+            quota_table.c.last_update_time < now - period
+        ).values(
+            last_update_time=quota_table.c.last_update_time + func.make_interval(
+                0, 0, 0, cast(periods * (QUOTA_PERIOD_SECONDS // 86400), Integer)
+            )
+        ).returning(quota_table.c.project_id).cte('due')
+        result = db.session.execute(
+            update(statistic_table).where(
+                statistic_table.c.project_id == due.c.project_id
+            ).values(
+                vuh_used=0,
+                dast_scans=0,
+                sast_scans=0,
+                performance_test_runs=0,
+                ui_performance_test_runs=0,
+            )
+        )
+        db.session.commit()
+        return result.rowcount
 
     @classmethod
     def check_quota(cls, project_id: int, quota: str) -> bool:
-        project_quota = ProjectQuota.query.filter_by(project_id=project_id).first()
-        ProjectQuota.update_time(project_quota)
-        project_quota = project_quota.to_json()
-        if project_quota:
-            if project_quota[quota] == -1:
+        return ProjectQuota.evaluate_quota(project_id, quota)
+
+    @staticmethod
+    def evaluate_quota(project_id: int, quota: str) -> bool:
+        """ Reads only the limit and usage needed for the quota, derived usage is computed on demand """
+        if quota in DERIVED_QUOTAS:
+            limit_column, get_usage = DERIVED_QUOTAS[quota]
+            limit = db.session.query(limit_column).filter(ProjectQuota.project_id == project_id).scalar()
+            if limit is None or limit == -1:
                 return True
-            statistic = Statistic.query.filter_by(project_id=project_id).first().to_json()
-            if statistic[quota] >= project_quota[quota]:
-                return False
-        return True
+            return get_usage(project_id) < limit * 1_000_000_000
+        if not hasattr(ProjectQuota, quota) or not hasattr(Statistic, quota):
+            raise KeyError(quota)
+        row = db.session.query(
+            getattr(ProjectQuota, quota), getattr(Statistic, quota)
+        ).join(
+            Statistic, Statistic.project_id == ProjectQuota.project_id
+        ).filter(
+            ProjectQuota.project_id == project_id
+        ).first()
+        if not row:
+            return True
+        limit, used = row
+        if limit is None or limit == -1:
+            return True
+        return (used or 0) < limit
 
     @staticmethod
     def check_quota_json(project_id: int, quota: str):
@@ -148,3 +186,11 @@ class ProjectQuota(db_tools.AbstractBaseMixin, db.Base):
         except TypeError:
             return None
 
+
+# quota name -> (limit column in gigabytes, usage getter in bytes)
+DERIVED_QUOTAS = {
+    'storage_space': (
+        ProjectQuota.storage_hard_limit,
+        lambda project_id: StorageUsage.get_or_seed_usage(project_id) or 0
+    ),
+}
@@ -12,11 +12,15 @@
 #     See the License for the specific language governing permissions and
 #     limitations under the License.
 
-from sqlalchemy import Column, Integer, String, DateTime
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
 
-from tools import db, db_tools, rpc_tools, MinioClient, data_tools
+from sqlalchemy import Column, Integer, String, DateTime, update, bindparam
 
-from .project import Project
+from tools import db, db_tools, rpc_tools, data_tools
+
+from .storage_usage import StorageUsage
 
 
 class Statistic(db_tools.AbstractBaseMixin, db.Base, rpc_tools.RpcMixin):
@@ -34,15 +38,62 @@ class Statistic(db_tools.AbstractBaseMixin, db.Base, rpc_tools.RpcMixin):
     ui_performance_test_runs = Column(Integer, unique=False, default=0)
     tasks_executions = Column(Integer, unique=False, default=0)
 
-    def to_json(self, exclude_fields: tuple = ()) -> dict:
-        json_dict = super().to_json()
-        project = Project.query.get_or_404(json_dict["project_id"])
-        minio_client = MinioClient(project=project)
-        buckets_list = minio_client.list_bucket()
-        storage_space = 0
-        for bucket in buckets_list:
-            for file in minio_client.list_files(bucket):
-                storage_space += file["size"]
-        json_dict["storage_space"] = round(storage_space/1000000, 2)
-        json_dict["tasks_count"] = self.rpc.call.tasks_count(project_id=project.id)
+    COUNTER_COLUMNS = (
+        'vuh_used', 'performance_test_runs', 'sast_scans', 'dast_scans',
+        'public_pool_workers', 'ui_performance_test_runs', 'tasks_executions',
+    )
+
+    @staticmethod
+    def increment(project_id: int, column: str, amount: int = 1) -> None:
+        """ Atomic UPDATE ... SET column = column + amount """
+        if column not in Statistic.COUNTER_COLUMNS:
+            raise KeyError(column)
+        Statistic.query.filter(Statistic.project_id == project_id).update(
+            {column: getattr(Statistic, column) + amount}, synchronize_session=False
+        )
+        db.session.commit()
+
+    @staticmethod
+    def bulk_increment(increments: dict) -> None:
+        """ Applies {(project_id, column): amount} with one executemany UPDATE """
+        by_project = defaultdict(lambda: dict.fromkeys(Statistic.COUNTER_COLUMNS, 0))
+        for (project_id, column), amount in increments.items():
+            if column not in Statistic.COUNTER_COLUMNS:
+                raise KeyError(column)
+            by_project[project_id][column] += amount
+        if not by_project:
+            return
+        stmt = update(Statistic.__table__).where(
+            Statistic.__table__.c.project_id == bindparam('_project_id')
+        ).values({
+            column: Statistic.__table__.c[column] + bindparam(column) for column in Statistic.COUNTER_COLUMNS
+        })
+        db.session.execute(stmt, [
+            {'_project_id': project_id, **amounts} for project_id, amounts in by_project.items()
+        ])
+        db.session.commit()
+
+    DERIVED_FIELDS = ('storage_space', 'tasks_count')
+
+    def get_storage_space(self) -> float:
+        storage_space = StorageUsage.get_or_seed_usage(self.project_id) or 0
+        return round(storage_space/1000000, 2)
+
+    def to_json(self, exclude_fields: tuple = (), fields: Optional[Iterable[str]] = None) -> dict:
+        """ fields limits output to selected fields, derived ones are computed only when selected """
+        json_dict = super().to_json(exclude_fields=exclude_fields)
+        if fields is not None:
+            fields = set(fields)
+            json_dict = {k: v for k, v in json_dict.items() if k in fields or k == 'project_id'}
+        derived = [i for i in self.DERIVED_FIELDS if fields is None or i in fields]
+        if 'tasks_count' in derived and 'storage_space' in derived:
+            # storage space uses db session, so it stays in this thread while tasks are counted over rpc
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                tasks_count = pool.submit(self.rpc.call.tasks_count, project_id=self.project_id)
+                json_dict["storage_space"] = self.get_storage_space()
+                json_dict["tasks_count"] = tasks_count.result()
+        elif 'storage_space' in derived:
+            json_dict["storage_space"] = self.get_storage_space()
+        elif 'tasks_count' in derived:
+            json_dict["tasks_count"] = self.rpc.call.tasks_count(project_id=self.project_id)
         return json_dict
@@ -0,0 +1,129 @@
+#     Copyright 2020 getcarrier.io
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+from typing import Optional
+
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime, UniqueConstraint, func
+from sqlalchemy.dialects.postgresql import insert
+
+from tools import db, db_tools, data_tools, MinioClient
+
+from .project import Project
+
+
+class StorageUsage(db_tools.AbstractBaseMixin, db.Base):
+    """ Per-project, per-bucket storage ledger. Kept up to date by the plugins writing to minio
+    and reconciled by a scheduled rescan, so reading project storage does not list minio """
+    __tablename__ = "project_storage_usage"
+    __table_args__ = (
+        UniqueConstraint('project_id', 'bucket', name='uq_project_storage_usage_project_bucket'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, unique=False, nullable=False, index=True)
+    bucket = Column(String(256), unique=False, nullable=False)
+    size = Column(BigInteger, unique=False, nullable=False, default=0)
+    updated_at = Column(DateTime, server_default=data_tools.utcnow(), onupdate=func.now())
+
+    @staticmethod
+    def update_usage(project_id: int, bucket: str, delta: int) -> None:
+        if StorageUsage.get_project_usage(project_id) is None:
+            project = Project.query.get(project_id)
+            if project is not None:
+                # ledger is not seeded yet: the listing already includes this change
+                StorageUsage.rescan(project)
+                return
+        stmt = insert(StorageUsage).values(
+            project_id=project_id, bucket=bucket, size=max(delta, 0)
+        ).on_conflict_do_update(
+            index_elements=['project_id', 'bucket'],
+            set_={
+                'size': func.greatest(StorageUsage.size + delta, 0),
+                'updated_at': func.now()
+            }
+        )
+        db.session.execute(stmt)
+        db.session.commit()
+
+    @staticmethod
+    def set_usage(project_id: int, bucket: str, size: int) -> None:
+        stmt = insert(StorageUsage).values(
+            project_id=project_id, bucket=bucket, size=size
+        ).on_conflict_do_update(
+            index_elements=['project_id', 'bucket'],
+            set_={'size': size, 'updated_at': func.now()}
+        )
+        db.session.execute(stmt)
+        db.session.commit()
+
+    @staticmethod
+    def remove_usage(project_id: int, bucket: Optional[str] = None) -> None:
+        query = StorageUsage.query.filter(StorageUsage.project_id == project_id)
+        if bucket:
+            query = query.filter(StorageUsage.bucket == bucket)
+        query.delete()
+        db.session.commit()
+
+    @staticmethod
+    def get_project_usage(project_id: int) -> Optional[int]:
+        """ Returns total bytes used by project or None if the ledger has no entries for it yet """
+        total, buckets = db.session.query(
+            func.sum(StorageUsage.size), func.count(StorageUsage.id)
+        ).filter(
+            StorageUsage.project_id == project_id
+        ).one()
+        if not buckets:
+            return None
+        return int(total or 0)
+
+    @staticmethod
+    def get_or_seed_usage(project_id: int) -> Optional[int]:
+        """ Returns total bytes used by project, seeding the ledger from minio on first read.
+        None if there is no such project """
+        usage = StorageUsage.get_project_usage(project_id)
+        if usage is None:
+            project = Project.query.get(project_id)
+            if project is None:
+                return None
+            usage = StorageUsage.rescan(project)
+        return usage
+
+    @staticmethod
+    def get_projects_usage(project_ids: list[int]) -> dict[int, int]:
+        """ Returns total bytes per project for projects present in the ledger """
+        if not project_ids:
+            return {}
+        rows = db.session.query(
+            StorageUsage.project_id, func.sum(StorageUsage.size)
+        ).filter(
+            StorageUsage.project_id.in_(project_ids)
+        ).group_by(
+            StorageUsage.project_id
+        ).all()
+        return {project_id: int(total or 0) for project_id, total in rows}
+
+    @staticmethod
+    def rescan(project) -> int:
+        """ Recalculates project usage from minio and overwrites the ledger """
+        minio_client = MinioClient(project=project)
+        usage = {}
+        for bucket in minio_client.list_bucket():
+            usage[bucket] = sum(file["size"] for file in minio_client.list_files(bucket))
+        for bucket, size in usage.items():
+            StorageUsage.set_usage(project.id, bucket, size)
+        stale = StorageUsage.query.filter(StorageUsage.project_id == project.id)
+        if usage:
+            stale = stale.filter(StorageUsage.bucket.notin_(list(usage.keys())))
+        stale.delete(synchronize_session=False)
+        db.session.commit()
+        return sum(usage.values())
@@ -14,6 +14,7 @@
 
 """ Module """
 
+import threading
 from collections import defaultdict
 from queue import Empty
 
@@ -25,7 +26,7 @@ from pylon.core.tools.context import Context as Holder
 from .models.project import Project
 from sqlalchemy.exc import ProgrammingError
 from tools import db_migrations, config as c  # pylint: disable=E0401
-from .utils.rabbit_utils import fix_rabbit_vhost
+from .utils.rabbit_utils import reconcile_rabbit_vhosts
 
 
 class Module(module.ModuleModel):
@@ -34,6 +35,10 @@ class Module(module.ModuleModel):
         self.descriptor = descriptor
 
         self.visitors = defaultdict(dict)  # use for creating personal projects for each user
+        self.rabbit_reconciliation = {'state': 'pending'}
+        self.statistics_aggregator = None
+        self.project_jobs = None
+        self.project_pool = None
 
     def init(self):
         """ Init module """
@@ -56,6 +61,25 @@ class Module(module.ModuleModel):
         from .init_db import init_db
         init_db()
 
+        from .utils.statistics_aggregator import StatisticsAggregator
+        self.statistics_aggregator = StatisticsAggregator(interval=pc.STATISTICS_FLUSH_INTERVAL)
+        self.statistics_aggregator.start()
+
+        from .utils.jobs import JobManager
+        self.project_jobs = JobManager(
+            max_workers=pc.PROJECT_JOBS_WORKERS,
+            history_size=pc.PROJECT_JOBS_HISTORY_SIZE,
+            history_ttl=pc.PROJECT_JOBS_HISTORY_TTL
+        )
+
+        pool_size = int(self.descriptor.config.get('project_pool_size', pc.PROJECT_POOL_SIZE))
+        if pool_size > 0:
+            from .utils.project_pool import ProjectPool
+            self.project_pool = ProjectPool(
+                self, size=pool_size,
+                interval=self.descriptor.config.get('project_pool_fill_interval', pc.PROJECT_POOL_FILL_INTERVAL)
+            )
+
         self.descriptor.init_api()
         self.descriptor.init_events()
         self.descriptor.init_rpcs()
@@ -70,17 +94,32 @@ class Module(module.ModuleModel):
 
         # rabbit_tools.create_administration_user_and_vhost()
 
-        for p in Project.query.all():
-            try:
-                fix_rabbit_vhost(p)
-            except:
-                log.warning('Couldn\'t fix rabbit for project %s', p)
-
+        project_ids = [i[0] for i in Project.query.with_entities(Project.id).all()]
+        threading.Thread(
+            target=self._reconcile_rabbit, args=(project_ids,),
+            name='projects_rabbit_reconcile', daemon=True
+        ).start()
 
+        if self.project_pool is not None:
+            # started after rpcs are registered: pool steps call them
+            self.project_pool.start()
 
     def deinit(self):  # pylint: disable=R0201
         """ De-init module """
         log.info("De-initializing module")
+        if self.statistics_aggregator is not None:
+            self.statistics_aggregator.stop()
+        if self.project_jobs is not None:
+            self.project_jobs.shutdown()
+        if self.project_pool is not None:
+            self.project_pool.stop()
+
+    def _reconcile_rabbit(self, project_ids: list) -> None:
+        try:
+            reconcile_rabbit_vhosts(project_ids, status=self.rabbit_reconciliation)
+        except Exception as e:
+            self.rabbit_reconciliation['state'] = 'failed'
+            log.warning('Rabbit reconciliation failed: %s', e)
 
     def _before_request_hook(self):
         flask.g.project = Holder()
@@ -95,3 +134,17 @@ class Module(module.ModuleModel):
             'active': False
         }
         self.context.rpc_manager.timeout(5).scheduling_create_if_not_exists(schedule_data)
+        schedule_data = {
+            'name': 'projects_rollover_quota_periods',
+            'cron': '0 * * * *',
+            'rpc_func': 'projects_rollover_quota_periods',
+            'active': True
+        }
+        self.context.rpc_manager.timeout(5).scheduling_create_if_not_exists(schedule_data)
+        schedule_data = {
+            'name': 'projects_storage_usage_reconcile',
+            'cron': '0 3 * * *',
+            'rpc_func': 'projects_storage_usage_reconcile',
+            'active': True
+        }
+        self.context.rpc_manager.timeout(5).scheduling_create_if_not_exists(schedule_data)
@@ -1,8 +1,6 @@
 from typing import Union, Optional
-import redis
-import json
 
-from ..models.project import Project
+from ..models.project import Project, project_cache
 from ..models.quota import ProjectQuota
 from ..models.statistics import Statistic
 
@@ -10,7 +8,8 @@ from tools import rpc_tools
 from pylon.core.tools import web, log
 
 from ..tools.session_project import SessionProject
-from tools import constants
+from ..utils import queue_registry, secrets_cache
+from ..utils.statistics import get_projects_statistics
 
 
 class RPC:
@@ -19,6 +18,17 @@ class RPC:
     def prj_or_404(self, project_id):
         return Project.query.get_or_404(project_id)
 
+    @web.rpc('project_get_cached', 'get_cached')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def get_cached(self, project_id: int) -> Optional[dict]:
+        """ Read-only project values from cache, use project_get_or_404 to change the project """
+        return Project.get_cached(project_id)
+
+    @web.rpc('project_cache_stats', 'cache_stats')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def cache_stats(self) -> dict:
+        return project_cache.stats
+
     @web.rpc('project_list', 'list')
     @rpc_tools.wrap_exceptions(RuntimeError)
     def list_projects(self, **kwargs):
@@ -29,15 +39,32 @@ class RPC:
     # def get_project_statistics(self, project_id):
     #     return Statistic.query.filter_by(project_id=project_id).first().to_json()
 
+    @web.rpc('projects_get_statistics', 'get_statistics')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def get_statistics(self, project_ids: Optional[list] = None,
+                       limit_: Optional[int] = None, offset_: Optional[int] = None,
+                       fields: Optional[list] = None) -> dict:
+        return get_projects_statistics(
+            project_ids, rpc_manager=self.context.rpc_manager, limit_=limit_, offset_=offset_, fields=fields
+        )
+
+    @web.rpc('projects_get_job', 'get_job')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def get_job(self, job_id: str) -> Optional[dict]:
+        job = self.project_jobs.get(job_id)
+        if job:
+            return job.to_json()
+
+    @web.rpc('projects_pool_status', 'pool_status')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def pool_status(self) -> Optional[dict]:
+        if self.project_pool is not None:
+            return self.project_pool.status()
+
     @web.rpc('projects_add_task_execution', 'add_task_execution')
     @rpc_tools.wrap_exceptions(RuntimeError)
-    def add_task_execution(self, project_id):
-        try:
-            statistic = Statistic.query.filter_by(project_id=project_id).first()
-            setattr(statistic, 'tasks_executions', Statistic.tasks_executions + 1)
-            statistic.commit()
-        except AttributeError:
-            ...
+    def add_task_execution(self, project_id, buffered: bool = False):
+        self.increment_statistics(project_id, 'tasks_executions', buffered=buffered)
 
     @web.rpc('project_get_storage_space_quota', 'get_storage_space_quota')
     @rpc_tools.wrap_exceptions(RuntimeError)
@@ -49,13 +76,20 @@ class RPC:
     def check_quota(self, project_id, quota=None):
         return ProjectQuota.check_quota_json(project_id, quota)
 
+    @web.rpc('projects_rollover_quota_periods', 'rollover_quota_periods')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def rollover_quota_periods(self) -> int:
+        rolled_over = ProjectQuota.rollover_due_periods()
+        log.info('Quota periods rolled over for %s projects', rolled_over)
+        return rolled_over
+
     @web.rpc('project_get_id', 'get_id')
     @rpc_tools.wrap_exceptions(RuntimeError)
     def get_id(self) -> Optional[int]:
         project_id = SessionProject.get()
-        project = Project.query.get(project_id)
+        project = Project.get_cached(project_id)
         if project:
-            return project.id
+            return project['id']
         SessionProject.pop()
         return None
         # if not project_id:
@@ -69,38 +103,35 @@ class RPC:
 
     @web.rpc('increment_statistics', 'increment_statistics')
     @rpc_tools.wrap_exceptions(RuntimeError)
-    def increment_statistics(self, project_id, column: str, amount: int = 1):
-        statistic = Statistic.query.filter_by(project_id=project_id).first()
-        setattr(statistic, column, getattr(statistic, column) + amount)
-        statistic.commit()
+    def increment_statistics(self, project_id, column: str, amount: int = 1, buffered: bool = False):
+        if buffered:
+            self.statistics_aggregator.add(project_id, column, amount)
+        else:
+            Statistic.increment(project_id, column, amount)
+
+    @web.rpc('projects_invalidate_secrets_cache', 'invalidate_secrets_cache')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def invalidate_secrets_cache(self, project_id: Optional[int] = None) -> None:
+        """ To be called by plugins changing vault secrets, project_id None means global secrets """
+        secrets_cache.invalidate(project_id)
+
+    @web.rpc('projects_rabbit_reconciliation_status', 'rabbit_reconciliation_status')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def rabbit_reconciliation_status(self) -> dict:
+        return self.rabbit_reconciliation
 
     @web.rpc('register_rabbit_queue', 'register_rabbit_queue')
     @rpc_tools.wrap_exceptions(RuntimeError)
     def register_rabbit_queue(self, vhost, queue_name):
-        _rc = redis.Redis(host=constants.REDIS_HOST, port=constants.REDIS_PORT, db=constants.REDIS_RABBIT_DB,
-                          password=constants.REDIS_PASSWORD, username=constants.REDIS_USER)
-        queues = _rc.get(name=vhost)
-        queues = json.loads(queues) if queues else []
-        if queue_name not in queues:
-            queues.append(queue_name)
-            _rc.set(name=vhost, value=json.dumps(queues))
+        if queue_registry.register_queue(vhost, queue_name):
             return f"Queue with name {queue_name} registered"
         return f"Queue with name {queue_name} already exist"
 
     @web.rpc('get_rabbit_queues', 'get_rabbit_queues')
     @rpc_tools.wrap_exceptions(RuntimeError)
     def get_rabbit_queues(self, vhost: str, remove_internal: bool = False) -> list:
-        _rc = redis.Redis(
-            host=constants.REDIS_HOST, port=constants.REDIS_PORT, db=constants.REDIS_RABBIT_DB,
-            password=constants.REDIS_PASSWORD, username=constants.REDIS_USER
-        )
-        try:
-            # log.info('get_rabbit_queues vhost: [%s], RC.get %s', vhost, _rc.get(name=vhost))
-            raw = _rc.get(name=vhost)
-            log.info('get_rabbit_queues vhost: [%s], queues: [%s]', vhost, raw)
-            queues = json.loads(raw)
-        except TypeError:
-            return []
+        queues = queue_registry.get_queues(vhost)
+        log.info('get_rabbit_queues vhost: [%s], queues: [%s]', vhost, queues)
         if remove_internal:
             try:
                 queues.remove('__internal')
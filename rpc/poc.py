@@ -1,4 +1,5 @@
 from collections import defaultdict
+from queue import Empty
 import re
 from traceback import format_exc
 from typing import Optional
@@ -11,12 +12,16 @@ from pylon.core.tools import log
 
 from ..models.project import Project
 from ..models.pd.project import ProjectCreatePD
+from ..utils import get_users_by_email, invalidate_users_index, find_user_by_email
+from ..utils.batch_rpc import call_batch_rpc, call_batch_write_rpc
 from ..utils.project_steps import create_project
 from ..constants import PROJECT_PERSONAL_NAME_TEMPLATE, PROJECT_USER_EMAIL_TEMPLATE
 
 
-def create_keycloak_user(user_email: str, *, rpc_manager, default_password: str = "11111111") -> None:
-    keycloak_token = rpc_manager.call.auth_manager_get_token()
+def create_keycloak_user(user_email: str, *, rpc_manager, default_password: str = "11111111",
+                         keycloak_token: Optional[str] = None) -> None:
+    if keycloak_token is None:
+        keycloak_token = rpc_manager.call.auth_manager_get_token()
     user_data = {
         "username": user_email,
         "email": user_email,
@@ -49,17 +54,53 @@ def create_keycloak_user(user_email: str, *, rpc_manager, default_password: str
     log.info('after keycloak')
 
 
+def get_user_project_ids(user_id: int, *, rpc_manager) -> Optional[list[int]]:
+    """ Resolves all project memberships of a user in a single call to admin plugin.
+    Returns None if batch lookup is not available """
+    try:
+        return call_batch_rpc(rpc_manager, 'admin_get_user_project_ids', user_id, timeout=5)
+    except (Empty, RuntimeError) as e:
+        log.warning('Batch membership lookup is not available: %s', e)
+        return None
+
+
+def get_token_user_ids(token_ids: list[int], *, rpc_manager) -> set[int]:
+    """ Resolves owners of tokens in a single call to auth plugin, falls back to per-token calls """
+    if not token_ids:
+        return set()
+    try:
+        tokens = call_batch_rpc(rpc_manager, 'auth_get_tokens', token_ids, timeout=5)
+    except Empty:
+        tokens = [rpc_manager.call.auth_get_token(token_id) for token_id in token_ids]
+    return {token['user_id'] for token in tokens}
+
 
 class RPC:
     @web.rpc("list_user_projects", "list_user_projects")
     @rpc_tools.wrap_exceptions(RuntimeError)
-    def list_user_projects(self, user_id: int, **kwargs) -> list:
+    def list_user_projects(self, user_id: int, **kwargs) -> list | dict:
+        project_ids = get_user_project_ids(user_id, rpc_manager=self.context.rpc_manager)
+        if project_ids is not None:
+            return self.list(project_ids=project_ids, **kwargs)
+        # fallback: check membership per project and paginate after filtering
+        offset_ = int(kwargs.pop('offset_', None) or 0)
+        limit_ = kwargs.pop('limit_', None)
+        after_id = kwargs.pop('after_id', None)
+        with_total = kwargs.pop('with_total', False)
         all_projects = self.list(**kwargs)
-        # log.info(f"projects {user_id=} {all_projects=}")
         user_projects = list()
         for project in all_projects:
             if self.context.rpc_manager.call.admin_check_user_in_project(project["id"], user_id):
                 user_projects.append(project)
+        total = len(user_projects)
+        if after_id is not None:
+            user_projects = [p for p in user_projects if p["id"] > int(after_id)]
+        if limit_:
+            user_projects = user_projects[offset_:offset_ + int(limit_)]
+        else:
+            user_projects = user_projects[offset_:]
+        if with_total:
+            return Project.paginate_result(user_projects, total, limit_)
         return user_projects
 
     @web.rpc("add_user_to_project_or_create", "add_user_to_project_or_create")
@@ -70,74 +111,118 @@ class RPC:
             project_id: int,
             roles: list[str],
     ):
-        user = None
-        user_email = user_email.lower()
-        for i in auth.list_users():
-            if i['email'] == user_email:
-                user = i
-                break
-        if user:
-            project_users = self.context.rpc_manager.call.admin_get_users_ids_in_project(project_id)
-            user_exists = False
-            for user_id in project_users:
-                if user['id'] == user_id:
-                    user_exists = True
-                    break
-            if user_exists:
-                return {
-                    'msg': f'user {user["email"]} already exists in project {project_id}',
-                    'status': 'error',
+        return self.add_users_to_project_or_create([user_email], project_id, roles)[0]
+
+    @web.rpc("add_users_to_project_or_create", "add_users_to_project_or_create")
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def add_users_to_project_or_create(
+            self,
+            user_emails: list[str],
+            project_id: int,
+            roles: list[str],
+    ) -> list[dict]:
+        rpc_manager = self.context.rpc_manager
+        project_users = set(rpc_manager.call.admin_get_users_ids_in_project(project_id))
+        results = list()
+        to_add = dict()  # user_id -> result
+        keycloak_token = None
+        created = False
+        for user_email in dict.fromkeys(i.lower() for i in user_emails):
+            user = find_user_by_email(user_email)
+            if user:
+                if user['id'] in project_users:
+                    results.append({
+                        'msg': f'user {user["email"]} already exists in project {project_id}',
+                        'status': 'error',
+                        'email': user["email"]
+                    })
+                    continue
+                log.info('user %s found. adding to project', user)
+                result = {
+                    'msg': f'user {user["email"]} added to project {project_id}',
+                    'status': 'ok',
                     'email': user["email"]
                 }
-            log.info('user %s found. adding to project', user)
-            self.context.rpc_manager.call.admin_add_user_to_project(
-                project_id, user['id'], roles
-            )
-            return {
-                'msg': f'user {user["email"]} added to project {project_id}',
-                'status': 'ok',
-                'email': user["email"]
-            }
-        else:
-            log.info('user %s not found. creating user', user_email)
-            try:
-                create_keycloak_user(user_email, rpc_manager=self.context.rpc_manager)
-            except Exception as e:
-                log.warning(f'Keycloak user cannot be created {e}')
+                to_add[user['id']] = result
+            else:
+                log.info('user %s not found. creating user', user_email)
+                try:
+                    if keycloak_token is None:
+                        keycloak_token = rpc_manager.call.auth_manager_get_token()
+                    create_keycloak_user(user_email, rpc_manager=rpc_manager, keycloak_token=keycloak_token)
+                except Exception as e:
+                    log.warning(f'Keycloak user cannot be created {e}')
 
-            user_id = auth.add_user(user_email)
-            # auth.add_user_provider(user_id, user_name)
-            auth.add_user_provider(user_id, user_email)
-            auth.add_user_group(user_id, 1)
+                user_id = auth.add_user(user_email)
+                # auth.add_user_provider(user_id, user_name)
+                auth.add_user_provider(user_id, user_email)
+                auth.add_user_group(user_id, 1)
+                created = True
 
-            self.context.rpc_manager.call.admin_add_user_to_project(
-                project_id, user_id, roles
-            )
-            return {
-                'msg': f'user {user_email} created and added to project {project_id}',
-                'status': 'ok',
-                'email': user_email
-            }
+                result = {
+                    'msg': f'user {user_email} created and added to project {project_id}',
+                    'status': 'ok',
+                    'email': user_email
+                }
+                to_add[user_id] = result
+            results.append(result)
+        if created:
+            invalidate_users_index()
+
+        if to_add:
+            try:
+                call_batch_write_rpc(
+                    rpc_manager, 'admin_add_users_to_project', project_id, list(to_add.keys()), roles, timeout=30
+                )
+            except Empty:
+                log.warning('Bulk membership is not available, adding users one by one')
+                for user_id in to_add.keys():
+                    rpc_manager.call.admin_add_user_to_project(project_id, user_id, roles)
+            except RuntimeError as e:
+                # bulk call may still go through, adding users one by one could duplicate memberships
+                log.warning('Bulk membership for project %s failed: %s', project_id, e)
+                for result in to_add.values():
+                    result.update({
+                        'msg': f'membership of user {result["email"]} in project {project_id} is unknown: {e}',
+                        'status': 'error',
+                    })
+        return results
 
     @web.rpc("projects_create_personal_project", "create_personal_project")
     @rpc_tools.wrap_exceptions(RuntimeError)
     def create_personal_project(self) -> None:
-        for user_data in self.visitors.values():
+        visitors, self.visitors = self.visitors, defaultdict(dict)
+        user_ids = set()
+        token_ids = list()
+        for user_data in visitors.values():
             if not isinstance(user_data.get('id', ''), int):
                 continue
-
-            user_id = user_data['id']
             if user_data.get('type', '') == 'token':
-                user_id = self.context.rpc_manager.call.auth_get_token(user_data['id'])['user_id']
+                token_ids.append(user_data['id'])
+            else:
+                user_ids.add(user_data['id'])
+        user_ids.update(get_token_user_ids(token_ids, rpc_manager=self.context.rpc_manager))
+        if not user_ids:
+            return
 
-            project_name = PROJECT_PERSONAL_NAME_TEMPLATE.format(user_id=user_id)
-            projects = Project.list_projects()
-            if any(project['name'] == project_name for project in projects):
-                continue
+        project_names = {
+            PROJECT_PERSONAL_NAME_TEMPLATE.format(user_id=user_id): user_id for user_id in user_ids
+        }
+        existing = {
+            i[0] for i in Project.query.with_entities(Project.name).filter(
+                Project.name.in_(list(project_names.keys()))
+            ).all()
+        }
+        missing = {name: user_id for name, user_id in project_names.items() if name not in existing}
+        if not missing:
+            return
 
+        emails = {user['id']: user['email'] for user in get_users_by_email().values()}
+        for project_name, user_id in missing.items():
+            user_email = emails.get(user_id) or self.context.rpc_manager.call.auth_get_user(user_id)['email']
             project_model = ProjectCreatePD(
                 name=project_name,
-                project_admin_email=self.context.rpc_manager.call.auth_get_user(user_id)['email'],
+                project_admin_email=user_email,
                 plugins=['configuration', 'models']
             )
 
@@ -154,8 +239,6 @@ class RPC:
             except Exception:
                 log.critical(format_exc())
 
-        self.visitors = defaultdict(dict)
-
     @web.rpc("projects_get_personal_project_id", "get_personal_project_id")
     @rpc_tools.wrap_exceptions(RuntimeError)
     def get_personal_project_id(self, user_id: int) -> int | None:
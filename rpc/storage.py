@@ -0,0 +1,38 @@
+from typing import Optional
+
+from tools import rpc_tools
+from pylon.core.tools import web, log
+
+from ..models.project import Project
+from ..models.storage_usage import StorageUsage
+
+
+class RPC:
+    @web.rpc('projects_storage_usage_update', 'storage_usage_update')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def storage_usage_update(self, project_id: int, bucket: str, delta: int) -> None:
+        """ Called by plugins writing to minio: positive delta on upload, negative on delete """
+        StorageUsage.update_usage(project_id, bucket, delta)
+
+    @web.rpc('projects_storage_usage_remove_bucket', 'storage_usage_remove_bucket')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def storage_usage_remove_bucket(self, project_id: int, bucket: str) -> None:
+        StorageUsage.remove_usage(project_id, bucket)
+
+    @web.rpc('projects_storage_usage_get', 'storage_usage_get')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def storage_usage_get(self, project_id: int) -> Optional[int]:
+        return StorageUsage.get_project_usage(project_id)
+
+    @web.rpc('projects_storage_usage_reconcile', 'storage_usage_reconcile')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def storage_usage_reconcile(self, project_id: Optional[int] = None) -> None:
+        if project_id:
+            projects = [Project.query.get_or_404(project_id)]
+        else:
+            projects = Project.query.all()
+        for project in projects:
+            try:
+                StorageUsage.rescan(project)
+            except Exception as e:
+                log.warning('Storage usage rescan failed for project %s: %s', project.id, e)
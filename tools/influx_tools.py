@@ -16,17 +16,30 @@ from typing import Optional
 from influxdb import InfluxDBClient
 from tools import VaultClient
 
+from ..constants import INFLUX_CLIENTS_CACHE_SIZE, INFLUX_CLIENTS_CACHE_TTL
+from ..utils import secrets_cache
+from ..utils.cache import TTLCache
+
+# (project_id, db_name, host, port, user, password, kwargs) -> InfluxDBClient
+clients_cache = TTLCache(maxsize=INFLUX_CLIENTS_CACHE_SIZE, ttl=INFLUX_CLIENTS_CACHE_TTL)
+
 
 def get_client(
         project_id: int, db_name: Optional[str] = None,
         vault_client: Optional[VaultClient] = None,
         secrets: Optional[dict] = None,
+        cached: bool = False,
         **kwargs
 ):
+    """ cached=True reuses one client per project, database and credentials and looks secrets up in
+    secrets_cache. The client is shared between callers and threads: never switch_database,
+    switch_user or close it. Without it every call gets its own client """
     if secrets:
         all_secrets = secrets
     elif vault_client:
         all_secrets = vault_client.get_all_secrets()
+    elif cached:
+        all_secrets = secrets_cache.get_all_secrets(project_id)
     else:
         all_secrets = VaultClient.from_project(project_id).get_all_secrets()
     influx_host = all_secrets.get("influx_ip", "")
@@ -34,4 +47,19 @@ def get_client(
     influx_user = all_secrets.get("influx_user", "")
     influx_password = all_secrets.get("influx_password", "")
 
-    return InfluxDBClient(influx_host, influx_port, influx_user, influx_password, db_name, **kwargs)
+    if not cached:
+        return InfluxDBClient(influx_host, influx_port, influx_user, influx_password, db_name, **kwargs)
+
+    try:
+        key = (
+            project_id, db_name, influx_host, influx_port, influx_user, influx_password,
+            tuple(sorted(kwargs.items()))
+        )
+        hash(key)
+    except TypeError:
+        return InfluxDBClient(influx_host, influx_port, influx_user, influx_password, db_name, **kwargs)
+    client = clients_cache.get(key)
+    if client is None:
+        client = InfluxDBClient(influx_host, influx_port, influx_user, influx_password, db_name, **kwargs)
+        clients_cache.set(key, client)
+    return client
@@ -1,6 +1,9 @@
 from typing import Optional, Tuple
 
-from ..constants import PROJECT_USER_EMAIL_TEMPLATE, INFLUX_DATABASES
+from sqlalchemy.exc import NoResultFound
+
+from ..constants import PROJECT_USER_EMAIL_TEMPLATE, INFLUX_DATABASES, USERS_INDEX_TTL
+from .cache import TTLCache
 
 from tools import auth, constants as c
 
@@ -8,3 +11,33 @@ from tools import auth, constants as c
 def get_project_user(project_id: int) -> Optional[dict]:
     user_email = PROJECT_USER_EMAIL_TEMPLATE.format(project_id)
     return auth.get_user(email=user_email)
+
+
+users_index_cache = TTLCache(maxsize=1, ttl=USERS_INDEX_TTL)
+
+
+def get_users_by_email() -> dict:
+    """ Returns email -> user index built from auth users, cached until a user is created or ttl expires """
+    index = users_index_cache.get('users')
+    if index is None:
+        index = {i['email'].lower(): i for i in auth.list_users() if i.get('email')}
+        users_index_cache.set('users', index)
+    return index
+
+
+def invalidate_users_index() -> None:
+    users_index_cache.clear()
+
+
+def find_user_by_email(email: str) -> Optional[dict]:
+    """ Looks user up in the cached index. Misses are checked with auth, as users are also created
+    outside of this plugin (e.g. on first sso login), and the index is refreshed if the user exists """
+    user = get_users_by_email().get(email.lower())
+    if user is None:
+        try:
+            user = auth.get_user(email=email)
+        except (RuntimeError, NoResultFound):
+            user = None
+        if user:
+            invalidate_users_index()
+    return user
@@ -0,0 +1,58 @@
+from queue import Empty
+from typing import Any
+
+from pylon.core.tools import log
+
+from .cache import TTLCache
+from ..constants import ADMIN_BATCH_RPCS_PROBE, BATCH_RPC_PROBE_TIMEOUT, BATCH_RPC_RECHECK_INTERVAL
+
+# rpc name -> whether it answered last time, missing ones are re-probed after the interval
+availability_cache = TTLCache(maxsize=64, ttl=BATCH_RPC_RECHECK_INTERVAL)
+
+
+def call_batch_rpc(rpc_manager, name: str, *args, timeout: float, **kwargs) -> Any:
+    """ Calls read-only batch rpc other plugins may not provide. Raises Empty right away while the rpc is known
+    to be missing, so callers go to their per-item fallback without waiting for a timeout.
+    Until the rpc has answered once it is called with a short probe timeout """
+    available = availability_cache.get(name)
+    if available is False:
+        raise Empty(name)
+    try:
+        result = getattr(
+            rpc_manager.timeout(timeout if available else min(timeout, BATCH_RPC_PROBE_TIMEOUT)), name
+        )(*args, **kwargs)
+    except Empty:
+        log.warning('%s is not available, using fallback for %s s', name, BATCH_RPC_RECHECK_INTERVAL)
+        availability_cache.set(name, False)
+        raise
+    availability_cache.set(name, True, ttl=float('inf'))
+    return result
+
+
+def batch_write_rpc_available(rpc_manager, name: str, probe: str = ADMIN_BATCH_RPCS_PROBE) -> bool:
+    """ Asks read-only probe rpc whether batch write rpc is provided, without calling the write rpc itself """
+    available = availability_cache.get(name)
+    if available is not None:
+        return available
+    try:
+        available = name in getattr(rpc_manager.timeout(BATCH_RPC_PROBE_TIMEOUT), probe)()
+    except Empty:
+        available = False
+    if available:
+        availability_cache.set(name, True, ttl=float('inf'))
+    else:
+        log.warning('%s is not available, using fallback for %s s', name, BATCH_RPC_RECHECK_INTERVAL)
+        availability_cache.set(name, False)
+    return available
+
+
+def call_batch_write_rpc(rpc_manager, name: str, *args, timeout: float, **kwargs) -> Any:
+    """ Calls batch rpc which changes data. Raises Empty only if the probe says the rpc is missing,
+    so callers may fall back to per-item calls. A timeout of the call itself raises RuntimeError:
+    the changes may still be applied, repeating them item by item is not safe """
+    if not batch_write_rpc_available(rpc_manager, name):
+        raise Empty(name)
+    try:
+        return getattr(rpc_manager.timeout(timeout), name)(*args, **kwargs)
+    except Empty:
+        raise RuntimeError(f'{name} did not answer in {timeout} s, changes may be applied partially')
@@ -1,11 +1,23 @@
 from abc import ABC, abstractmethod
-from typing import Any
+from functools import partial
+from time import perf_counter
+from typing import Any, Callable, Iterable
 
 from pylon.core.tools import log
 
+from .metrics import observe_step
+
 
 class ProjectCreationStep(ABC):
-    all_steps = []
+    # context keys (or names of other steps) that must be available before the step can run
+    requires: tuple = ()
+    # context keys the step adds to the creation context
+    provides: tuple = ()
+    # step may run in a worker thread. It gets a detached snapshot of the project and uses the thread-local
+    # scoped db session, which is removed when the step finishes (see project_steps._run_in_worker)
+    parallel: bool = False
+    # step does not depend on the project owner and may run ahead of time for the warm pool
+    poolable: bool = True
 
     @property
     @abstractmethod
@@ -15,68 +27,14 @@ class ProjectCreationStep(ABC):
     def __eq__(self, other: 'ProjectCreationStep') -> bool:
         return self.name == other.name
 
-    def __new__(cls, *args, **kwargs):
-        klass = super().__new__(cls)
-        try:
-            index = ProjectCreationStep.all_steps.index(klass)
-            return ProjectCreationStep.all_steps[index]
-        except ValueError:
-            ProjectCreationStep.all_steps.append(klass)
-            return klass
+    def __hash__(self) -> int:
+        return hash(self.name)
 
     def __init__(self, module=None):
         self.module = module
-        self._created = {
-            'initialized': False,
-            'ok': None,
-            'msg': '',
-            'step': self.name
-        }
-        self._deleted = {
-            'initialized': False,
-            'ok': None,
-            'msg': '',
-            'step': self.name
-        }
-
-        self.create = self.check_status('_created')(self.create)
-        self.delete = self.check_status('_deleted')(self.delete)
-
-        log.info('Init step %s', self.name)
-
-    @property
-    def status(self) -> dict:
-        return {
-            'created': self._created,
-            'deleted': self._deleted
-        }
-
-    def check_status(self, bool_attr: str):
-        def decorator(func):
-            def wrapper(*args, **kwargs):
-                log.info('%s is called %s', self, bool_attr)
-                bound_property = getattr(self, bool_attr)
-                bound_property['initialized'] = True
-                try:
-                    result = func(*args, **kwargs)
-                    bound_property['ok'] = True
-                    return result
-                except Exception as e:
-                    bound_property['ok'] = False
-                    bound_property['msg'] = str(e)
-                    log.warning('%s Failed with %s', self, e)
-                    raise
-            return wrapper
-        return decorator
 
     def __repr__(self) -> str:
-        extra = []
-        if self._created['ok']:
-            extra.append('created')
-        if self._deleted['ok']:
-            extra.append('deleted')
-
-        return f'<Step: {self.name} {" ".join(extra)}>'
+        return f'<Step: {self.name}>'
 
     @abstractmethod
     def create(self, *args, **kwargs) -> dict | None | Any:
@@ -85,3 +43,60 @@ class ProjectCreationStep(ABC):
     @abstractmethod
     def delete(self, *args, **kwargs) -> Any:
         ...
+
+
+class StepsRun:
+    """ A single creation or deletion of a project. Owns its step instances and their statuses,
+    so any number of runs may go on concurrently """
+
+    def __init__(self, steps: Iterable[ProjectCreationStep], operation: str = 'create'):
+        if operation not in ('create', 'delete'):
+            raise ValueError(f'Unknown operation {operation}')
+        self.operation = operation
+        self.steps = list(steps)
+        self.statuses = {
+            step.name: {
+                'initialized': False,
+                'ok': None,
+                'msg': '',
+                'step': step.name,
+                'duration': None,
+                'error': None
+            }
+            for step in self.steps
+        }
+
+    def bind(self, step: ProjectCreationStep, **kwargs) -> Callable:
+        return partial(self.call, step, **kwargs)
+
+    def call(self, step: ProjectCreationStep, **kwargs) -> Any:
+        """ Runs create or delete of the step recording wall time and error class """
+        log.info('%s is called %s', step, self.operation)
+        func = step.create if self.operation == 'create' else step.delete
+        status = self.statuses[step.name]
+        status['initialized'] = True
+        status['error'] = None
+        started = perf_counter()
+        try:
+            result = func(**kwargs)
+            status['ok'] = True
+            return result
+        except Exception as e:
+            status['ok'] = False
+            status['msg'] = str(e)
+            status['error'] = type(e).__name__
+            log.warning('%s Failed with %s', step, e)
+            raise
+        finally:
+            duration = perf_counter() - started
+            status['duration'] = round(duration, 4)
+            observe_step(step.name, self.operation, duration, status['error'])
+
+    def mark_done(self, step_names: Iterable[str], msg: str = '') -> None:
+        """ Reports steps which were completed outside of this run """
+        for name in step_names:
+            self.statuses[name].update({'initialized': True, 'ok': True, 'msg': msg})
+
+    def to_json(self) -> list[dict]:
+        """ Statuses of the steps which have been started """
+        return [dict(status) for status in self.statuses.values() if status['initialized']]
@@ -0,0 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from traceback import format_exc
+from typing import Callable, Optional
+from uuid import uuid4
+
+from pylon.core.tools import log
+from tools import db
+
+from .cache import TTLCache
+from .helpers import StepsRun
+
+
+def _step_state(status: dict) -> str:
+    if not status['initialized']:
+        return 'pending'
+    if status['ok'] is None:
+        return 'running'
+    return 'done' if status['ok'] else 'failed'
+
+
+class ProjectJob:
+    """ Background creation or deletion of a project, reports per-step progress of its run """
+
+    def __init__(self, run: StepsRun, project_id: Optional[int] = None):
+        self.id = str(uuid4())
+        self.run = run
+        self.kind = run.operation
+        self.project_id = project_id
+        self.state = 'queued'
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def steps(self) -> list[dict]:
+        return [
+            {
+                'step': name,
+                'state': _step_state(status),
+                'ok': status['ok'],
+                'msg': status['msg'],
+                'duration': status['duration'],
+            }
+            for name, status in self.run.statuses.items()
+        ]
+
+    def to_json(self) -> dict:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'project_id': self.project_id,
+            'state': self.state,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'steps': self.steps,
+        }
+
+
+class JobManager:
+    """ Runs project jobs on a bounded pool and keeps their status for polling """
+
+    def __init__(self, max_workers: int, history_size: int = 1000, history_ttl: float = 86400):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='projects_jobs')
+        self.jobs = TTLCache(maxsize=history_size, ttl=history_ttl)
+
+    def submit(self, job: ProjectJob, func: Callable[[ProjectJob], None]) -> ProjectJob:
+        self.jobs.set(job.id, job)
+        self.pool.submit(self._run, job, func)
+        return job
+
+    def _run(self, job: ProjectJob, func: Callable[[ProjectJob], None]) -> None:
+        job.state = 'running'
+        job.started_at = datetime.utcnow()
+        try:
+            func(job)
+            job.state = 'done'
+        except Exception as e:
+            log.critical(format_exc())
+            job.state = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.utcnow()
+            self.jobs.set(job.id, job)
+            db.session.remove()
+
+    def get(self, job_id: str) -> Optional[ProjectJob]:
+        return self.jobs.get(job_id)
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
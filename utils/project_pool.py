@@ -0,0 +1,162 @@
+from contextlib import contextmanager
+from datetime import datetime
+from threading import Event, Lock, Thread
+from traceback import format_exc
+from typing import Callable, Optional
+from uuid import uuid4
+
+from sqlalchemy import select, func
+
+from pylon.core.tools import log
+from tools import db
+
+from .helpers import StepsRun
+from .project_steps import ProjectModel, delete_project, get_steps, provision_steps
+from ..constants import PROJECT_POOL_NAME_TEMPLATE, PROJECT_POOL_LOCK_ID, PROJECT_CREATION_WORKERS
+from ..models.pd.project import ProjectCreatePD
+from ..models.project import Project
+from ..models.statistics import Statistic
+
+
+@contextmanager
+def _fill_lock():
+    """ Only one process fills the pool at a time """
+    if db.engine.dialect.name != 'postgresql':
+        yield True
+        return
+    with db.engine.connect() as connection:
+        locked = connection.execute(select(func.pg_try_advisory_lock(PROJECT_POOL_LOCK_ID))).scalar()
+        try:
+            yield locked
+        finally:
+            if locked:
+                connection.execute(select(func.pg_advisory_unlock(PROJECT_POOL_LOCK_ID)))
+
+
+class ProjectPool:
+    """ Keeps `size` projects provisioned ahead of time by all poolable steps
+    (schema, buckets, permissions, system user, vault space, vhost, influx databases).
+    Creating a project claims one of them: renames it, assigns the owner, sets quotas
+    and runs only the steps which depend on the owner """
+
+    def __init__(self, module, size: int, interval: float):
+        self.module = module
+        self.size = size
+        self.interval = interval
+        self.claimed = 0
+        self.misses = 0
+        self.filled = 0
+        self.fill_errors = 0
+        self._stats_lock = Lock()
+        self._wakeup = Event()
+        self._stopped = Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._thread = Thread(target=self._loop, name='projects_pool', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+
+    def _loop(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.fill()
+            except Exception:
+                log.critical(format_exc())
+            finally:
+                db.session.remove()
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def fill(self) -> int:
+        """ Provisions missing projects, returns number of projects added """
+        added = 0
+        with _fill_lock() as locked:
+            if not locked:
+                return added
+            self.remove_stale()
+            missing = self.size - Project.count_pooled(ready_only=True)
+            while missing > 0 and not self._stopped.is_set():
+                if self.fill_one():
+                    added += 1
+                missing -= 1
+        return added
+
+    def remove_stale(self) -> None:
+        """ Retries teardown of pooled projects whose provisioning failed, called under the fill lock """
+        for project in Project.get_stale_pooled():
+            log.warning('Removing stale pooled project %s', project.id)
+            try:
+                delete_project(self.module, project)
+            except Exception:
+                log.critical(format_exc())
+
+    def fill_one(self) -> bool:
+        run = StepsRun([step for step in get_steps(self.module) if step.poolable], 'create')
+        context = {
+            # quotas and owner are set on claim
+            'project_model': ProjectCreatePD.construct(name=PROJECT_POOL_NAME_TEMPLATE.format(uuid4().hex[:12])),
+            'owner_id': 0,
+            'pooled': True,
+        }
+        try:
+            provision_steps(context, run)
+            context['project'].create_success = True
+            context['project'].commit()
+        except Exception:
+            log.critical(format_exc())
+            with self._stats_lock:
+                self.fill_errors += 1
+            if 'project' in context:
+                delete_project(self.module, context['project'])
+            return False
+        with self._stats_lock:
+            self.filled += 1
+        return True
+
+    def claim(self, context: dict, run: StepsRun, max_workers: int = PROJECT_CREATION_WORKERS,
+              on_start: Optional[Callable] = None, on_finish: Optional[Callable] = None) -> bool:
+        """ Turns a pooled project into the requested one. Returns False if the pool is empty """
+        if self.size <= 0:
+            return False
+        project_model: ProjectCreatePD = context['project_model']
+        project_id = Project.claim_pooled(project_model.name, context['owner_id'], project_model.plugins)
+        self._wakeup.set()
+        if project_id is None:
+            with self._stats_lock:
+                self.misses += 1
+            return False
+        with self._stats_lock:
+            self.claimed += 1
+        log.info('Claimed pooled project %s for %s', project_id, project_model.name)
+
+        ProjectModel.set_quota(project_id, project_model)
+        Statistic.query.filter(Statistic.project_id == project_id).update(
+            {'start_time': datetime.utcnow()}, synchronize_session=False
+        )
+        Statistic.commit()
+        context['project'] = Project.query.get(project_id)
+
+        owner_steps = [step for step in run.steps if not step.poolable]
+        run.mark_done([step.name for step in run.steps if step.poolable], msg='pre-provisioned')
+        if on_finish:
+            for step in run.steps:
+                if step.poolable:
+                    on_finish(step, None, None)
+        provision_steps(
+            context, run, owner_steps, max_workers=max_workers, on_start=on_start, on_finish=on_finish
+        )
+        return True
+
+    def status(self) -> dict:
+        return {
+            'size': self.size,
+            'available': Project.count_pooled(ready_only=True),
+            'claimed': self.claimed,
+            'misses': self.misses,
+            'filled': self.filled,
+            'fill_errors': self.fill_errors,
+        }
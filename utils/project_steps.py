@@ -1,20 +1,27 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 import json
-from typing import Optional
+from queue import Empty
+from typing import Callable, Iterable, Optional
 
 from sqlalchemy import schema
 from sqlalchemy.exc import NoResultFound
-from . import get_project_user
-from .helpers import ProjectCreationStep
+from . import get_project_user, invalidate_users_index, secrets_cache
+from .batch_rpc import call_batch_write_rpc
+from .helpers import ProjectCreationStep, StepsRun
+from .tenant_schema import create_project_schema
 from .rabbit_utils import password_generator, create_rabbit_user_and_vhost, \
     delete_rabbit_user_and_vhost
 from ..constants import INFLUX_DATABASES, PROJECT_SCHEMA_TEMPLATE, PROJECT_USER_NAME_TEMPLATE, \
-    PROJECT_USER_EMAIL_TEMPLATE, PROJECT_RABBIT_USER_TEMPLATE, PROJECT_RABBIT_VHOST_TEMPLATE
+    PROJECT_USER_EMAIL_TEMPLATE, PROJECT_RABBIT_USER_TEMPLATE, PROJECT_RABBIT_VHOST_TEMPLATE, \
+    PROJECT_CREATION_WORKERS, RABBIT_ADMIN_URL
 
 from ..models.pd.project import ProjectCreatePD
 from ..models.project import Project
 from ..models.quota import ProjectQuota
 from ..models.statistics import Statistic
+from ..models.storage_usage import StorageUsage
 
 from ..tools.influx_tools import get_client
 
@@ -24,17 +31,34 @@ from tools import db, VaultClient, auth, constants as c, TaskManager, MinioClien
 
 class ProjectModel(ProjectCreationStep):
     name = 'project_model'
+    requires = ('project_model', 'owner_id')
+    provides = ('project',)
 
-    def create(self, project_model: ProjectCreatePD, owner_id: int, **kwargs) -> dict[str, Project]:
+    def create(self, project_model: ProjectCreatePD, owner_id: int, pooled: bool = False,
+               **kwargs) -> dict[str, Project]:
         project = Project(
             name=project_model.name,
             plugins=project_model.plugins,
-            owner_id=owner_id
+            owner_id=owner_id,
+            pooled=pooled
         )
         project.insert()
         log.info('after project.insert()')
-        ProjectQuota.create(
+        self.set_quota(project.id, project_model)
+        log.info('after quota created')
+
+        statistic = Statistic(
             project_id=project.id,
+            start_time=datetime.utcnow(),
+        )
+        statistic.insert()
+        log.info('after statistic created')
+        return {'project': project}
+
+    @staticmethod
+    def set_quota(project_id: int, project_model: ProjectCreatePD) -> ProjectQuota:
+        return ProjectQuota.create(
+            project_id=project_id,
             data_retention_limit=project_model.data_retention_limit,
             test_duration_limit=project_model.test_duration_limit,
             cpu_limit=project_model.cpu_limit,
@@ -46,15 +70,6 @@ class ProjectModel(ProjectCreationStep):
             storage_soft_limit=project_model.storage_soft_limit,
             storage_limit_total_block=project_model.storage_limit_total_block,
         )
-        log.info('after quota created')
-
-        statistic = Statistic(
-            project_id=project.id,
-            start_time=str(datetime.utcnow()),
-        )
-        statistic.insert()
-        log.info('after statistic created')
-        return {'project': project}
 
     def delete(self, project: Project, **kwargs) -> None:
         Statistic.query.filter(Statistic.project_id == project.id).delete()
@@ -72,26 +87,30 @@ class ProjectModel(ProjectCreationStep):
 
 class MinioBuckets(ProjectCreationStep):
     name = 'minio_buckets'
+    requires = ('project',)
+    parallel = True
 
     def create(self, project: Project, **kwargs) -> None:
         mc = MinioClient(project)
         mc.create_bucket(bucket='reports', bucket_type='system')
         mc.create_bucket(bucket='tasks', bucket_type='system')
+        StorageUsage.set_usage(project.id, 'reports', 0)
+        StorageUsage.set_usage(project.id, 'tasks', 0)
 
     def delete(self, project: Project, **kwargs) -> None:
         mc = MinioClient(project)
         mc.remove_bucket('reports')
         mc.remove_bucket('tasks')
+        StorageUsage.remove_usage(project.id)
 
 
 class ProjectSchema(ProjectCreationStep):
     name = 'project_schema'
+    requires = ('project',)
+    parallel = True
 
     def create(self, project: Project, **kwargs) -> None:
-        with db.with_project_schema_session(project.id) as tenant_db:
-            tenant_db.execute(schema.CreateSchema(PROJECT_SCHEMA_TEMPLATE.format(project.id)))
-            db.get_all_metadata().create_all(bind=tenant_db.connection())
-            tenant_db.commit()
+        create_project_schema(project.id)
 
     def delete(self, project: Project, **kwargs) -> None:
         with db.with_project_schema_session(project.id) as tenant_db:
@@ -101,15 +120,27 @@ class ProjectSchema(ProjectCreationStep):
 
 class ProjectPermissions(ProjectCreationStep):
     name = 'project_permissions'
+    requires = ('project',)
+    parallel = True
 
     def create(self, project: Project, **kwargs) -> None:
         project_roles = auth.get_roles(mode='default')
         project_permissions = auth.get_permissions(mode='default')
         self.module.context.rpc_manager.call.admin_add_role(project.id, [i["name"] for i in project_roles])
+        role_permissions = defaultdict(list)
         for permission in project_permissions:
-            self.module.context.rpc_manager.call.admin_set_permission_for_role(
-                project.id, permission['name'], permission["permission"]
+            role_permissions[permission['name']].append(permission["permission"])
+        try:
+            call_batch_write_rpc(
+                self.module.context.rpc_manager, 'admin_set_permissions_for_roles',
+                project.id, dict(role_permissions), timeout=30
             )
+        except Empty:
+            log.warning('Bulk permission assignment is not available, setting permissions one by one')
+            for permission in project_permissions:
+                self.module.context.rpc_manager.call.admin_set_permission_for_role(
+                    project.id, permission['name'], permission["permission"]
+                )
 
     def delete(self, **kwargs) -> None:
         ...
@@ -117,17 +148,20 @@ class ProjectPermissions(ProjectCreationStep):
 
 class SystemUser(ProjectCreationStep):
     name = 'system_user'
+    requires = ('project', 'project_permissions')
+    provides = ('system_user_id',)
 
     def create(self, project: Project, **kwargs) -> dict:
         # Auth: create project user
         try:
             user = get_project_user(project.id)
-            return user['id']
+            return {'system_user_id': user['id']}
         except (NoResultFound, RuntimeError):
             ...
         user_name = PROJECT_USER_NAME_TEMPLATE.format(project.id)
         user_email = PROJECT_USER_EMAIL_TEMPLATE.format(project.id)
         user_id = auth.add_user(user_email, user_name)
+        invalidate_users_index()
         auth.assign_user_to_role(
             user_id=user_id,
             role_name='system',
@@ -142,6 +176,8 @@ class SystemUser(ProjectCreationStep):
 
 class SystemToken(ProjectCreationStep):
     name = 'system_token'
+    requires = ('system_user_id',)
+    provides = ('system_token',)
 
     def create(self, system_user_id: int, **kwargs) -> dict:
         # Auth: add project token
@@ -164,6 +200,8 @@ class SystemToken(ProjectCreationStep):
 
 class ProjectSecrets(ProjectCreationStep):
     name = 'project_secrets'
+    requires = ('project', 'system_token')
+    provides = ('vault_client',)
 
     def create(self, project: Project, system_token: str, **kwargs) -> dict[str, VaultClient]:
         vault_client = VaultClient.from_project(project)
@@ -172,7 +210,7 @@ class ProjectSecrets(ProjectCreationStep):
         project.commit()
 
         project_secrets = {
-            'backend_performance_results_retention': vault_client.get_all_secrets().get(
+            'backend_performance_results_retention': secrets_cache.get_all_secrets(project.id).get(
                 'backend_performance_results_retention',
                 c.BACKEND_PERFORMANCE_RESULTS_RETENTION
             )
@@ -184,20 +222,23 @@ class ProjectSecrets(ProjectCreationStep):
         project_hidden_secrets['project_id'] = project.id
         project_secrets["auth_token"] = system_token
 
-        vault_client.set_secrets(project_secrets)
-        vault_client.set_hidden_secrets(project_hidden_secrets)
+        secrets_cache.set_secrets(vault_client, project_secrets)
+        secrets_cache.set_hidden_secrets(vault_client, project_hidden_secrets)
 
         return {'vault_client': VaultClient.from_project(project)}
 
     def delete(self, project: Project, **kwargs) -> None:
         VaultClient.from_project(project).remove_project_space()
+        secrets_cache.invalidate(project.id)
 
 
 class RabbitVhost(ProjectCreationStep):
     name = 'rabbit_vhost'
+    requires = ('vault_client',)
+    parallel = True
 
     def create(self, vault_client: VaultClient, **kwargs) -> None:
-        all_secrets = vault_client.get_all_secrets()
+        all_secrets = secrets_cache.get_all_secrets()
 
         # prepare user credentials
         user = PROJECT_RABBIT_USER_TEMPLATE.format(vault_client.project_id)
@@ -205,7 +246,7 @@ class RabbitVhost(ProjectCreationStep):
         vhost = PROJECT_RABBIT_VHOST_TEMPLATE.format(vault_client.project_id)
 
         create_rabbit_user_and_vhost(
-            rabbit_admin_url='http://carrier-rabbit:15672',
+            rabbit_admin_url=RABBIT_ADMIN_URL,
             rabbit_admin_auth=(all_secrets["rabbit_user"], all_secrets["rabbit_password"]),
             user=user,
             password=password,
@@ -217,13 +258,13 @@ class RabbitVhost(ProjectCreationStep):
         secrets["rabbit_project_user"] = user
         secrets["rabbit_project_password"] = password
         secrets["rabbit_project_vhost"] = vhost
-        vault_client.set_secrets(secrets)
+        secrets_cache.set_secrets(vault_client, secrets)
 
     def delete(self, vault_client: VaultClient, **kwargs) -> None:
-        all_secrets = vault_client.get_all_secrets()
+        all_secrets = secrets_cache.get_all_secrets()
         secrets = vault_client.get_secrets()
         delete_rabbit_user_and_vhost(
-            rabbit_admin_url='http://carrier-rabbit:15672',
+            rabbit_admin_url=RABBIT_ADMIN_URL,
             rabbit_admin_auth=(all_secrets["rabbit_user"], all_secrets["rabbit_password"]),
             user=secrets["rabbit_project_user"],
             vhost=secrets["rabbit_project_vhost"]
@@ -232,11 +273,13 @@ class RabbitVhost(ProjectCreationStep):
 
 class InfluxDatabases(ProjectCreationStep):
     name = 'influx_databases'
+    requires = ('vault_client',)
+    parallel = True
 
     def create(self, vault_client: VaultClient, **kwargs) -> None:
         # vault_client = VaultClient.from_project(project_id)
-        secrets = vault_client.get_all_secrets()
-        client = get_client(vault_client.project_id, secrets=secrets)
+        secrets = secrets_cache.get_all_secrets(vault_client.project_id)
+        client = get_client(vault_client.project_id, secrets=secrets, cached=True)
         for i in INFLUX_DATABASES.keys():
             db_name = secrets.get(i)
             client.query(
@@ -245,8 +288,8 @@ class InfluxDatabases(ProjectCreationStep):
 
     def delete(self, vault_client: VaultClient, **kwargs) -> None:
         # vault_client = VaultClient.from_project(project_id)
-        secrets = vault_client.get_all_secrets()
-        client = get_client(vault_client.project_id, secrets=secrets)
+        secrets = secrets_cache.get_all_secrets(vault_client.project_id)
+        client = get_client(vault_client.project_id, secrets=secrets, cached=True)
         for i in INFLUX_DATABASES.keys():
             db_name = secrets.get(i)
             client.query(f"drop database {db_name}")
@@ -254,6 +297,8 @@ class InfluxDatabases(ProjectCreationStep):
 
 class ProjectAdmin(ProjectCreationStep):
     name = 'project_admin'
+    requires = ('project_model', 'project', 'roles', 'project_permissions')
+    poolable = False
 
     def create(self, project_model: ProjectCreatePD, project: Project, roles: list[str], **kwargs) -> None:
         self.module.add_user_to_project_or_create(
@@ -269,6 +314,8 @@ class ProjectAdmin(ProjectCreationStep):
 
 class Invitations(ProjectCreationStep):
     name = 'invitations'
+    requires = ('project_model', 'project_admin')
+    poolable = False
 
     def create(self, project_model: ProjectCreatePD, **kwargs) -> None:
         if project_model.invitation_integration:
@@ -291,38 +338,219 @@ class Invitations(ProjectCreationStep):
 
 # We initialize classes to form project creation sequence
 
+PROJECT_STEPS = [
+    ProjectModel,
+    MinioBuckets,
+    ProjectSchema,
+    ProjectPermissions,
+    SystemUser,
+    SystemToken,
+    ProjectSecrets,
+    RabbitVhost,
+    InfluxDatabases,
+    ProjectAdmin,
+    Invitations
+]
+
 
 def get_steps(module=None, reverse: bool = False):
-    steps = [
-        ProjectModel,
-        MinioBuckets,
-        ProjectSchema,
-        ProjectPermissions,
-        SystemUser,
-        SystemToken,
-        ProjectSecrets,
-        RabbitVhost,
-        InfluxDatabases,
-        ProjectAdmin,
-        Invitations
-    ]
+    steps = PROJECT_STEPS
     if reverse:
         steps = reversed(steps)
     for step in steps:
         yield step(module)
 
 
-def create_project(module, context: dict) -> list:
+def new_run(module=None, operation: str = 'create') -> StepsRun:
+    """ Fresh step instances and statuses for one creation or deletion """
+    return StepsRun(get_steps(module, reverse=operation == 'delete'), operation)
+
+
+def _validate_steps(steps: list, context: dict) -> None:
+    known = set(context.keys())
+    for step in steps:
+        known.update(step.provides)
+        known.add(step.name)
+    for step in steps:
+        missing = set(step.requires) - known
+        if missing:
+            raise RuntimeError(f'Step {step.name} requires {missing} which nothing provides')
+
+
+def get_dependencies(steps: list, context_keys: Iterable[str] = ()) -> dict[str, set[str]]:
+    """ step name -> names of steps which have to be created before it """
+    context_keys = set(context_keys)
+    dependencies = {}
+    for step in steps:
+        requires = set(step.requires) - context_keys
+        dependencies[step.name] = {
+            other.name for other in steps
+            if other is not step and (other.name in requires or requires.intersection(other.provides))
+        }
+    return dependencies
+
+
+def reverse_dependencies(dependencies: dict[str, set[str]]) -> dict[str, set[str]]:
+    """ step name -> names of steps which have to be deleted before it """
+    return {
+        name: {other for other, other_dependencies in dependencies.items() if name in other_dependencies}
+        for name in dependencies
+    }
+
+
+def _step_context(step: ProjectCreationStep, context: dict) -> dict:
+    if step.parallel and isinstance(context.get('project'), Project):
+        # worker threads must not touch the orm instance bound to this thread's session
+        return {**context, 'project': context['project'].snapshot()}
+    return context
+
+
+def _run_in_worker(func: Callable):
+    try:
+        return func()
+    finally:
+        db.session.remove()
+
+
+def execute_steps(steps: list, dependencies: dict[str, set[str]], bind: Callable[[ProjectCreationStep], Callable],
+                  *, max_workers: int = PROJECT_CREATION_WORKERS, stop_on_error: bool = True,
+                  on_start: Optional[Callable] = None, on_finish: Optional[Callable] = None) -> list:
+    """ Runs every step once the steps it depends on are finished.
+    bind(step) is evaluated in the calling thread and returns the callable to run.
+    Parallel steps go to a bounded thread pool, others run one by one in the calling thread.
+    on_start(step) and on_finish(step, result, error) are always called from the calling thread """
     progress = []
-    for step in get_steps(module):
+    pending = list(steps)
+    running = {}
+    finished = set()
+    errors = []
+
+    def start(step: ProjectCreationStep) -> None:
+        pending.remove(step)
         progress.append(step)
-        step_result = step.create(**context)
-        if step_result is not None:
+        if on_start:
+            on_start(step)
+
+    def finish(step: ProjectCreationStep, result=None, error: Optional[Exception] = None) -> None:
+        finished.add(step.name)
+        if error is not None:
+            errors.append(error)
+            log.warning('%s error %s', repr(step), error)
+        if on_finish:
+            on_finish(step, result, error)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='project_steps') as pool:
+        while True:
+            for future in [f for f in running if f.done()]:
+                step = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    finish(step, error=e)
+                else:
+                    finish(step, result)
+
+            if not errors or not stop_on_error:
+                ready = [step for step in pending if dependencies[step.name] <= finished]
+                for step in ready:
+                    if step.parallel:
+                        func = bind(step)
+                        start(step)
+                        running[pool.submit(_run_in_worker, func)] = step
+                serial = [step for step in ready if not step.parallel]
+                if serial:
+                    step = serial[0]
+                    func = bind(step)
+                    start(step)
+                    try:
+                        result = func()
+                    except Exception as e:
+                        finish(step, error=e)
+                    else:
+                        finish(step, result)
+                    continue
+
+            if not running:
+                break
+            wait(running, return_when=FIRST_COMPLETED)
+
+    progress.sort(key=steps.index)
+    if errors and stop_on_error:
+        raise errors[0]
+    if pending and not errors:
+        raise RuntimeError(f'Steps {[step.name for step in pending]} could not be started')
+    return progress
+
+
+def provision_steps(context: dict, run: StepsRun, steps: Optional[list] = None,
+                    max_workers: int = PROJECT_CREATION_WORKERS,
+                    on_start: Optional[Callable] = None, on_finish: Optional[Callable] = None) -> None:
+    """ Runs creation steps of the run (or the given subset of them) as soon as their requirements are met.
+    Results of the steps are added to the context """
+    if steps is None:
+        steps = run.steps
+        _validate_steps(steps, context)
+
+    def apply_result(step: ProjectCreationStep, step_result, error: Optional[Exception]) -> None:
+        if error is None and step_result is not None:
             if isinstance(step_result, dict):
                 context.update(step_result)
             else:
                 context[step.name] = step_result
-    context['project'].create_success = True
-    context['project'].commit()
+        if on_finish:
+            on_finish(step, step_result, error)
+
+    execute_steps(
+        steps, get_dependencies(steps, context.keys()),
+        lambda step: run.bind(step, **_step_context(step, context)),
+        max_workers=max_workers, on_start=on_start, on_finish=apply_result
+    )
+
+
+def create_project(module, context: dict, max_workers: int = PROJECT_CREATION_WORKERS,
+                   on_start: Optional[Callable] = None, on_finish: Optional[Callable] = None,
+                   run: Optional[StepsRun] = None) -> StepsRun:
+    """ Claims a pre-provisioned project from the warm pool if there is one,
+    otherwise runs all creation steps. Pass a run to read step statuses if creation fails """
+    if run is None:
+        run = new_run(module)
+    pool = getattr(module, 'project_pool', None)
+    claimed = pool is not None and pool.claim(
+        context, run, max_workers=max_workers, on_start=on_start, on_finish=on_finish
+    )
+    if not claimed:
+        provision_steps(context, run, max_workers=max_workers, on_start=on_start, on_finish=on_finish)
+        context['project'].create_success = True
+        context['project'].commit()
+
+    Project.invalidate_cache(context['project'].id)
     module.context.event_manager.fire_event('project_created', context['project'].to_json())
-    return progress
+    return run
+
+
+def delete_project(module, project: Project, max_workers: int = PROJECT_CREATION_WORKERS,
+                   on_start: Optional[Callable] = None, on_finish: Optional[Callable] = None,
+                   run: Optional[StepsRun] = None) -> StepsRun:
+    """ Tears steps down in reverse dependency order, independent steps in parallel.
+    Failed steps are logged and do not stop the teardown """
+    try:
+        system_user_id = get_project_user(project.id)['id']
+    except (RuntimeError, KeyError, NoResultFound):
+        system_user_id = None
+
+    context = {
+        'project': project,
+        'vault_client': VaultClient.from_project(project),
+        'system_user_id': system_user_id
+    }
+    project_id = project.id
+    if run is None:
+        run = new_run(module, 'delete')
+    steps = run.steps
+    execute_steps(
+        steps, reverse_dependencies(get_dependencies(steps)),
+        lambda step: run.bind(step, **_step_context(step, context)),
+        max_workers=max_workers, stop_on_error=False, on_start=on_start, on_finish=on_finish
+    )
+    Project.invalidate_cache(project_id)
+    return run
@@ -0,0 +1,82 @@
+import json
+from threading import Lock
+from typing import Optional
+
+import redis
+from pylon.core.tools import log
+from tools import constants
+
+_pool: Optional[redis.ConnectionPool] = None
+_pool_lock = Lock()
+
+
+def get_redis_client() -> redis.Redis:
+    """ Returns client backed by module-level connection pool shared by all registry calls """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = redis.ConnectionPool(
+                    host=constants.REDIS_HOST, port=constants.REDIS_PORT, db=constants.REDIS_RABBIT_DB,
+                    password=constants.REDIS_PASSWORD, username=constants.REDIS_USER,
+                    decode_responses=True
+                )
+    return redis.Redis(connection_pool=_pool)
+
+
+def _migrate_legacy_key(rc: redis.Redis, vhost: str) -> None:
+    """ Converts queues stored as json-encoded list into native redis set. Runs under WATCH,
+    so concurrent callers reaching the same legacy key migrate it once """
+    def migrate(pipe: redis.client.Pipeline) -> None:
+        if pipe.type(vhost) != 'string':
+            # already migrated by another caller
+            return
+        raw = pipe.get(vhost)
+        queues = json.loads(raw) if raw else []
+        log.info('Migrating rabbit queues registry for [%s] to redis set', vhost)
+        pipe.multi()
+        pipe.delete(vhost)
+        if queues:
+            pipe.sadd(vhost, *queues)
+
+    rc.transaction(migrate, vhost)
+
+
+def _is_wrong_type(e: redis.ResponseError) -> bool:
+    return str(e).startswith('WRONGTYPE')
+
+
+def register_queue(vhost: str, queue_name: str) -> bool:
+    """ Returns True if queue was added, False if it has already been registered """
+    rc = get_redis_client()
+    try:
+        return bool(rc.sadd(vhost, queue_name))
+    except redis.ResponseError as e:
+        if not _is_wrong_type(e):
+            raise
+        _migrate_legacy_key(rc, vhost)
+        return bool(rc.sadd(vhost, queue_name))
+
+
+def get_queues(vhost: str) -> list:
+    rc = get_redis_client()
+    try:
+        queues = rc.smembers(vhost)
+    except redis.ResponseError as e:
+        if not _is_wrong_type(e):
+            raise
+        _migrate_legacy_key(rc, vhost)
+        queues = rc.smembers(vhost)
+    return sorted(queues)
+
+
+def set_queues(queues_map: dict) -> None:
+    """ Replaces queues of every vhost in the map in one pipelined transaction """
+    if not queues_map:
+        return
+    pipe = get_redis_client().pipeline(transaction=True)
+    for vhost, queues in queues_map.items():
+        pipe.delete(vhost)
+        if queues:
+            pipe.sadd(vhost, *queues)
+    pipe.execute()
@@ -11,16 +11,18 @@
 #   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
-from typing import Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import monotonic
+from typing import Tuple, Optional
 
-from ..constants import PROJECT_RABBIT_USER_TEMPLATE, PROJECT_RABBIT_VHOST_TEMPLATE
+from ..constants import PROJECT_RABBIT_USER_TEMPLATE, PROJECT_RABBIT_VHOST_TEMPLATE, RABBIT_ADMIN_URL, \
+    RABBIT_RECONCILE_WORKERS
 from rabbitmq_admin import AdminAPI
 import random
 import string
 from pylon.core.tools import log
 
-from ..models.project import Project
-from tools import VaultClient
+from . import secrets_cache
 
 
 def password_generator(length=16):
@@ -61,16 +63,63 @@ def delete_rabbit_user_and_vhost(rabbit_admin_url: str, rabbit_admin_auth: Tuple
     rabbit_client.delete_vhost(vhost)
 
 
-def fix_rabbit_vhost(project: Project) -> None:
-    log.info('Fixing rabbit queues for project %s', project.id)
-    vc = VaultClient(project)
-    all_secrets = vc.get_all_secrets()
-
-    create_rabbit_user_and_vhost(
-        rabbit_admin_url='http://carrier-rabbit:15672',
-        rabbit_admin_auth=(all_secrets["rabbit_user"], all_secrets["rabbit_password"]),
-        user=all_secrets['rabbit_project_user'],
-        password=all_secrets['rabbit_project_password'],
-        vhost=all_secrets['rabbit_project_vhost']
+def reconcile_rabbit_vhosts(project_ids: list[int], max_workers: int = RABBIT_RECONCILE_WORKERS,
+                            status: Optional[dict] = None) -> dict:
+    """ Creates missing rabbit vhosts, users and permissions for given projects.
+    Existing state is fetched from management api once, vault is read only for projects needing a fix """
+    status = status if status is not None else {}
+    started = monotonic()
+    status.update({
+        'state': 'running', 'total': len(project_ids), 'missing': 0, 'processed': 0,
+        'fixed': 0, 'failed': [], 'fetch_seconds': None, 'total_seconds': None
+    })
+
+    admin_secrets = secrets_cache.get_all_secrets()
+    rabbit_client = AdminAPI(
+        url=RABBIT_ADMIN_URL,
+        auth=(admin_secrets["rabbit_user"], admin_secrets["rabbit_password"])
     )
-
+    vhosts = {i['name'] for i in rabbit_client.list_vhosts()}
+    users = {i['name'] for i in rabbit_client.list_users()}
+    permissions = {(i['user'], i['vhost']) for i in rabbit_client.list_permissions()}
+    status['fetch_seconds'] = round(monotonic() - started, 3)
+
+    missing = []
+    for project_id in project_ids:
+        user = PROJECT_RABBIT_USER_TEMPLATE.format(project_id)
+        vhost = PROJECT_RABBIT_VHOST_TEMPLATE.format(project_id)
+        if vhost not in vhosts or user not in users or (user, vhost) not in permissions:
+            missing.append(project_id)
+    status['missing'] = len(missing)
+    log.info('Rabbit reconciliation: %s of %s projects need fixing, state fetched in %ss',
+             len(missing), len(project_ids), status['fetch_seconds'])
+
+    def fix(project_id: int) -> None:
+        secrets = secrets_cache.get_all_secrets(project_id)
+        user = secrets['rabbit_project_user']
+        vhost = secrets['rabbit_project_vhost']
+        if vhost not in vhosts:
+            rabbit_client.create_vhost(vhost)
+        if user not in users:
+            rabbit_client.create_user(user, secrets['rabbit_project_password'])
+        if (user, vhost) not in permissions:
+            rabbit_client.create_user_permission(user, vhost)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='rabbit_reconcile') as pool:
+        futures = {pool.submit(fix, project_id): project_id for project_id in missing}
+        for future in as_completed(futures):
+            status['processed'] += 1
+            try:
+                future.result()
+                status['fixed'] += 1
+            except Exception as e:
+                status['failed'].append(futures[future])
+                log.warning('Couldn\'t fix rabbit for project %s: %s', futures[future], e)
+            if status['processed'] % 100 == 0:
+                log.info('Rabbit reconciliation progress: %s/%s', status['processed'], len(missing))
+
+    status['total_seconds'] = round(monotonic() - started, 3)
+    status['state'] = 'done'
+    log.info('Rabbit reconciliation done in %ss: fixed %s, failed %s',
+             status['total_seconds'], status['fixed'], len(status['failed']))
+    return status
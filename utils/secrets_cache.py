@@ -0,0 +1,58 @@
+from collections import defaultdict
+from threading import Lock
+from typing import Optional
+
+from tools import VaultClient
+
+from ..constants import SECRETS_CACHE_SIZE, SECRETS_CACHE_TTL
+from .cache import TTLCache
+
+GLOBAL_SCOPE = 'global'
+
+# project id or GLOBAL_SCOPE -> all secrets
+secrets_cache = TTLCache(maxsize=SECRETS_CACHE_SIZE, ttl=SECRETS_CACHE_TTL)
+# bumped by invalidate, a vault read which overlapped with an invalidation is not cached
+_generations = defaultdict(int)
+_global_generation = 0
+_generations_lock = Lock()
+
+
+def _generation(key) -> tuple:
+    with _generations_lock:
+        return _global_generation, _generations[key]
+
+
+def get_all_secrets(project_id: Optional[int] = None) -> dict:
+    """ Cached VaultClient.get_all_secrets, project_id None reads global secrets """
+    key = GLOBAL_SCOPE if project_id is None else project_id
+    all_secrets = secrets_cache.get(key)
+    if all_secrets is None:
+        generation = _generation(key)
+        vault_client = VaultClient() if project_id is None else VaultClient.from_project(project_id)
+        all_secrets = vault_client.get_all_secrets()
+        with _generations_lock:
+            if generation == (_global_generation, _generations[key]):
+                secrets_cache.set(key, all_secrets)
+    return dict(all_secrets)
+
+
+def invalidate(project_id: Optional[int] = None) -> None:
+    """ Project secrets include global ones, so global invalidation drops everything """
+    global _global_generation
+    with _generations_lock:
+        if project_id is None:
+            _global_generation += 1
+            secrets_cache.clear()
+        else:
+            _generations[project_id] += 1
+            secrets_cache.invalidate(project_id)
+
+
+def set_secrets(vault_client: VaultClient, secrets: dict) -> None:
+    vault_client.set_secrets(secrets)
+    invalidate(vault_client.project_id)
+
+
+def set_hidden_secrets(vault_client: VaultClient, secrets: dict) -> None:
+    vault_client.set_hidden_secrets(secrets)
+    invalidate(vault_client.project_id)
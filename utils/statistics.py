@@ -0,0 +1,87 @@
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty
+from typing import Iterable, Optional
+
+from pylon.core.tools import log
+from tools import db
+
+from .batch_rpc import call_batch_rpc
+from ..models.project import Project
+from ..models.quota import ProjectQuota
+from ..models.statistics import Statistic
+from ..models.storage_usage import StorageUsage
+
+STATISTICS_FIELDS = (
+    "performance_test_runs", "ui_performance_test_runs", "sast_scans", "dast_scans", "storage_space",
+    "tasks_count", "tasks_executions"
+)
+
+
+def get_tasks_count(project_ids: list[int], *, rpc_manager) -> dict[int, int]:
+    """ Counts tasks of all projects in one call to tasks plugin, falls back to per-project calls """
+    if not project_ids:
+        return {}
+    try:
+        counts = call_batch_rpc(rpc_manager, 'tasks_count_by_projects', project_ids=project_ids, timeout=5)
+        return {int(k): v for k, v in counts.items()}
+    except Empty:
+        return {project_id: rpc_manager.call.tasks_count(project_id=project_id) for project_id in project_ids}
+
+
+def get_storage_space(project_ids: list[int]) -> dict[int, int]:
+    usage = StorageUsage.get_projects_usage(project_ids)
+    for project_id in set(project_ids) - set(usage.keys()):
+        # ledger is not seeded for this project yet
+        try:
+            usage[project_id] = StorageUsage.rescan(Project.query.get(project_id))
+        except Exception as e:
+            log.warning('Storage usage rescan failed for project %s: %s', project_id, e)
+            usage[project_id] = 0
+    return usage
+
+
+def format_statistics(statistic: dict, quota: dict, fields: Optional[Iterable[str]] = None) -> dict:
+    stats = {}
+    for each in STATISTICS_FIELDS:
+        if fields is None or each in fields:
+            stats[each] = {"current": statistic.get(each), "quota": quota.get(each)}
+    if fields is None or "data_retention_limit" in fields:
+        stats["data_retention_limit"] = {"current": 0, "quota": quota.get("data_retention_limit")}
+    return stats
+
+
+def get_projects_statistics(project_ids: Optional[list[int]] = None, *, rpc_manager,
+                            limit_: Optional[int] = None, offset_: Optional[int] = None,
+                            fields: Optional[Iterable[str]] = None) -> dict[int, dict]:
+    """ Statistics with quotas for given projects (or a page of all projects) using one joined query
+    and bulk lookups of derived fields, which are computed only when selected """
+    fields = set(fields) if fields is not None else None
+    query = db.session.query(Statistic, ProjectQuota).join(
+        ProjectQuota, ProjectQuota.project_id == Statistic.project_id
+    ).join(
+        Project, Project.id == Statistic.project_id
+    ).filter(Project.pooled.is_(False))
+    if project_ids is not None:
+        query = query.filter(Statistic.project_id.in_(project_ids))
+    rows = query.order_by(Statistic.project_id).limit(limit_).offset(offset_).all()
+
+    ids = [statistic.project_id for statistic, _ in rows]
+    storage_space, tasks_count = {}, {}
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        tasks_future = None
+        if fields is None or "tasks_count" in fields:
+            tasks_future = pool.submit(get_tasks_count, ids, rpc_manager=rpc_manager)
+        if fields is None or "storage_space" in fields:
+            storage_space = get_storage_space(ids)
+        if tasks_future is not None:
+            tasks_count = tasks_future.result()
+
+    result = {}
+    for statistic, quota in rows:
+        statistic_json = statistic.to_json(fields=set(Statistic.COUNTER_COLUMNS))
+        if storage_space:
+            statistic_json["storage_space"] = round(storage_space.get(statistic.project_id, 0) / 1000000, 2)
+        if tasks_count:
+            statistic_json["tasks_count"] = tasks_count.get(statistic.project_id)
+        result[statistic.project_id] = format_statistics(statistic_json, quota.to_json(), fields)
+    return result
@@ -0,0 +1,56 @@
+from collections import defaultdict
+from threading import Lock, Thread, Event
+
+from pylon.core.tools import log
+from tools import db
+
+from ..models.statistics import Statistic
+
+
+class StatisticsAggregator:
+    """ Write-behind buffer merging statistic increments per (project, column) in memory.
+    Buffered increments are flushed in one batched UPDATE every interval and on stop """
+
+    def __init__(self, interval: float = 2):
+        self.interval = interval
+        self._increments = defaultdict(int)
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+
+    def add(self, project_id: int, column: str, amount: int = 1) -> None:
+        if column not in Statistic.COUNTER_COLUMNS:
+            raise KeyError(column)
+        with self._lock:
+            self._increments[(project_id, column)] += amount
+
+    def flush(self) -> None:
+        with self._lock:
+            increments, self._increments = self._increments, defaultdict(int)
+        if not increments:
+            return
+        try:
+            Statistic.bulk_increment(increments)
+        except Exception as e:
+            log.warning('Statistics flush failed, keeping %s increments for retry: %s', len(increments), e)
+            db.session.rollback()
+            with self._lock:
+                for key, amount in increments.items():
+                    self._increments[key] += amount
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.flush()
+            db.session.remove()
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name='projects_statistics_flush', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 2)
+            self._thread = None
+        self.flush()
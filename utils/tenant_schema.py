@@ -0,0 +1,91 @@
+from threading import Lock
+from typing import Optional
+
+from sqlalchemy import MetaData, create_mock_engine, schema
+
+from pylon.core.tools import log
+from tools import db
+
+from ..constants import PROJECT_SCHEMA_TEMPLATE
+
+TENANT_SCHEMA_TOKEN = '__projects_tenant_schema__'
+
+
+def _fingerprint(metadata: MetaData, schemas: set) -> tuple:
+    return tuple(sorted(
+        (
+            table.key,
+            tuple((column.name, repr(column.type), column.nullable) for column in table.columns),
+            tuple(sorted(index.name or '' for index in table.indexes)),
+        )
+        for table in metadata.tables.values() if table.schema in schemas
+    ))
+
+
+class TenantDDL:
+    """ DDL of tenant tables compiled once per process and rendered for every new project schema.
+    Recompiled when tables registered in metadata change """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._fingerprint = None
+        self._script = None
+
+    def compile(self, connection, metadata: MetaData, translate_map: dict) -> str:
+        tables = [table for table in metadata.sorted_tables if table.schema in translate_map]
+        elements = []
+        create_all_engine = create_mock_engine(connection.engine.url, lambda sql, *args, **kwargs: elements.append(sql))
+        metadata.create_all(create_all_engine, tables=tables, checkfirst=False)
+
+        # named paramstyle: literals are not %-escaped, the script is executed without parameters
+        dialect = type(connection.dialect)(paramstyle='named')
+        token_map = {key: TENANT_SCHEMA_TOKEN for key in translate_map}
+        statements = []
+        for element in elements:
+            sql = str(element.compile(
+                dialect=dialect, schema_translate_map=token_map, render_schema_translate=True
+            )).strip()
+            target = element.element
+            target_schema = getattr(target, 'schema', None) or getattr(getattr(target, 'table', None), 'schema', None)
+            if target_schema not in translate_map:
+                # shared objects (e.g. enum types outside the tenant schema) may already exist
+                sql = f'DO $$ BEGIN {sql}; EXCEPTION WHEN duplicate_object OR duplicate_table THEN NULL; END $$'
+            statements.append(sql)
+        log.info('Compiled tenant DDL: %s tables, %s statements', len(tables), len(statements))
+        return ';\n'.join(statements)
+
+    def get_script(self, connection, metadata: MetaData, translate_map: dict) -> str:
+        fingerprint = _fingerprint(metadata, set(translate_map))
+        with self._lock:
+            if self._fingerprint != fingerprint:
+                self._script = self.compile(connection, metadata, translate_map)
+                self._fingerprint = fingerprint
+            return self._script
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._fingerprint = None
+            self._script = None
+
+
+tenant_ddl = TenantDDL()
+
+
+def create_project_schema(project_id: int) -> None:
+    """ Creates schema with all tenant tables in one transaction and one round trip """
+    schema_name = PROJECT_SCHEMA_TEMPLATE.format(project_id)
+    with db.with_project_schema_session(project_id) as tenant_db:
+        connection = tenant_db.connection()
+        translate_map: Optional[dict] = connection.get_execution_options().get('schema_translate_map')
+        metadata = db.get_all_metadata()
+        if not translate_map:
+            tenant_db.execute(schema.CreateSchema(schema_name))
+            metadata.create_all(bind=connection)
+        else:
+            script = tenant_ddl.get_script(connection, metadata, translate_map)
+            create_schema = str(schema.CreateSchema(schema_name).compile(dialect=connection.dialect))
+            connection.exec_driver_sql(
+                ';\n'.join(filter(None, [create_schema, script.replace(TENANT_SCHEMA_TOKEN, schema_name)])),
+                execution_options={'no_parameters': True}
+            )
+        tenant_db.commit()